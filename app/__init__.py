@@ -1,11 +1,19 @@
 # app/__init__.py
 from __future__ import annotations
 
-from flask import Flask, render_template, jsonify
+import hashlib
+import os
+
+import click
+from flask import Flask, render_template, request
+from config import Config
 from .extensions import init_extensions, db
-from .core.models import ensure_admin
-from .views.setup import bp as setup_bp
-from .views.users import bp as users_bp
+
+# Config é lida uma vez por processo (os valores já são fixados no import de config.py)
+_CONFIG_DICT = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+
+# Corpo fixo do healthcheck: evita montar dict + serializar JSON a cada probe
+_HEALTH_BODY = b'{"ok":true}\n'
 
 def create_app():
     app = Flask(
@@ -14,14 +22,19 @@ def create_app():
         static_folder="static",
         static_url_path="/static",
     )
-    app.config.from_object("config.Config")
+    app.config.update(_CONFIG_DICT)
+    # "/auth/login/" e "/products" casam direto, sem o 308 de barra final
+    app.url_map.strict_slashes = False
 
     init_extensions(app)
 
+    # Imports tardios: views e forms só são carregados quando a app é criada
     from .auth.routes import bp as auth_bp
     from .views.dashboard import bp as dashboard_bp
     from .views.products import bp as products_bp
     from .views.pos import bp as pos_bp
+    from .views.setup import bp as setup_bp
+    from .views.users import bp as users_bp
 
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(dashboard_bp)
@@ -32,13 +45,83 @@ def create_app():
 
     @app.get("/health")
     def health():
-        return jsonify(ok=True)
+        return app.response_class(
+            _HEALTH_BODY, mimetype="application/json", headers={"Cache-Control": "no-store"}
+        )
+
+    # Estáticos versionados pelo conteúdo: url_for('static') ganha ?v=<hash> e essas
+    # respostas ficam 1 ano no navegador (o hash muda junto com o arquivo). Sem ?v
+    # vale o SEND_FILE_MAX_AGE_DEFAULT da Config. Em debug o hash é refeito a cada URL.
+    _static_versions = {}
+
+    @app.url_defaults
+    def static_version(endpoint, values):
+        if endpoint != "static" or "v" in values or not values.get("filename"):
+            return
+        filename = values["filename"]
+        v = None if app.debug else _static_versions.get(filename)
+        if v is None:
+            try:
+                with open(os.path.join(app.static_folder, filename), "rb") as fh:
+                    v = hashlib.md5(fh.read(), usedforsecurity=False).hexdigest()[:12]
+            except OSError:
+                return
+            _static_versions[filename] = v
+        values["v"] = v
+
+    @app.after_request
+    def static_cache(resp):
+        if request.endpoint == "static" and "v" in request.args and resp.status_code == 200:
+            resp.cache_control.public = True
+            resp.cache_control.max_age = 31536000
+            resp.cache_control.immutable = True
+        return resp
+
+    # Páginas de erro não dependem da request (sem usuário/flash): renderiza uma vez só.
+    # O cache de templates compilados do Jinja (auto_reload off fora do debug) cobre o resto.
+    _static_pages = {}
+
+    def _error_page(code: int):
+        html = _static_pages.get(code)
+        if html is None:
+            html = _static_pages[code] = render_template(f"{code}.html")
+        return html, code
+
+    @app.errorhandler(403)
+    def forbidden(e):
+        return _error_page(403)
 
     @app.errorhandler(404)
     def not_found(e):
-        return render_template("404.html"), 404
+        return _error_page(404)
 
-    with app.app_context():
+    @app.errorhandler(500)
+    def server_error(e):
+        return _error_page(500)
+
+    @app.cli.command("init-db")
+    @click.option("--admin", is_flag=True, help="Cria também loja padrão e admin (ADMIN_EMAIL/ADMIN_PASS).")
+    def init_db(admin: bool):
+        """Cria as tabelas (e opcionalmente o admin inicial)."""
         db.create_all()
+        if admin:
+            from .core.models import ensure_admin
+            ensure_admin()
+        click.echo("Banco inicializado.")
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db():
+        """Atualiza um banco criado por versão anterior (colunas, índices, constraints)."""
+        from .core.upgrade import upgrade
+        try:
+            upgrade(log=click.echo)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo("Banco atualizado.")
+
+    # Conveniência de dev: em produção as tabelas vêm de `flask init-db` / migrations
+    if app.config.get("AUTO_CREATE_ALL"):
+        with app.app_context():
+            db.create_all()
 
-    return app
\ No newline at end of file
+    return app
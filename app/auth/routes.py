@@ -1,15 +1,75 @@
 # app/auth/routes.py
 from __future__ import annotations
+import time
+from typing import Any, Dict
 from urllib.parse import urlparse
 
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy import event, exists, func, select
 
+from sqlalchemy.orm import object_session
+
+from app.extensions import db, invalidate_after_commit
 from app.core.forms import LoginForm
 from app.core.models import User, Store
 
 bp = Blueprint("auth", __name__, template_folder="../templates")
 
+_LOGIN_CTX_TTL = 60  # segundos
+_login_ctx_cache: Dict[str, Any] = {}
+
+
+def _login_ctx() -> Dict[str, Any]:
+    """Loja e flags do primeiro acesso para a tela de login, em uma consulta só."""
+    hit = _login_ctx_cache.get("ctx")
+    if hit and time.monotonic() - hit[0] < _LOGIN_CTX_TTL:
+        return hit[1]
+
+    # A tela só pergunta "existe algum?": EXISTS para no primeiro registro
+    row = db.session.execute(
+        select(Store.nome, Store.cidade, Store.uf, exists(select(User.id)).label("tem_user"))
+        .order_by(Store.id)
+        .limit(1)
+        .execution_options(todas_lojas=True)  # visão global, cacheada para todos
+    ).first()
+    if row is None:
+        # Sem loja não há usuário (store_id é obrigatório)
+        ctx = {"store": None, "tem_loja": False, "tem_user": False}
+    else:
+        ctx = {
+            "store": {"nome": row.nome, "cidade": row.cidade, "uf": row.uf},
+            "tem_loja": True,
+            "tem_user": bool(row.tem_user),
+        }
+    _login_ctx_cache["ctx"] = (time.monotonic(), ctx)
+    return ctx
+
+
+def invalidate_login_ctx() -> None:
+    """Descarta o contexto do login (os eventos abaixo chamam no fim da transação)."""
+    _login_ctx_cache.pop("ctx", None)
+
+
+def _invalidate_login_ctx(_mapper, _conn, target) -> None:
+    invalidate_after_commit(object_session(target), invalidate_login_ctx)
+
+
+# Qualquer escrita em lojas/usuários deste processo invalida o banner, depois
+# do COMMIT (outros workers expiram pelo TTL)
+for _model, _evt in ((Store, "after_insert"), (Store, "after_update"), (Store, "after_delete"),
+                     (User, "after_insert"), (User, "after_delete")):
+    event.listen(_model, _evt, _invalidate_login_ctx)
+
+
+def _verify_password(user: User | None, raw: str) -> bool:
+    """Confere a senha; sem usuário roda o hash falso (mesmo custo)."""
+    # Na própria thread do request: mandar para um pool e esperar o .result()
+    # não libera nada, e um timeout viraria "senha incorreta" sob carga
+    if user is None:
+        return User.check_password_dummy(raw)
+    return user.check_password(raw)
+
 
 def _is_safe_next(nxt: str | None) -> bool:
     """Evita open redirect: só permite caminhos relativos (sem netloc)."""
@@ -19,39 +79,35 @@ def _is_safe_next(nxt: str | None) -> bool:
     return urlparse(nxt).netloc == ""
 
 
-@bp.get("/auth/login")
+@bp.get("/login")
 def login():
     if getattr(current_user, "is_authenticated", False):
         return redirect(url_for("dashboard.index"))
 
     form = LoginForm()
-    store = Store.query.first()
-    store_count = Store.query.count()
-    user_count = User.query.count()
-    return render_template(
-        "auth_login.html",
-        form=form,
-        store=store,
-        store_count=store_count,
-        user_count=user_count,
-    )
-
-
-@bp.post("/auth/login")
+    return render_template("auth_login.html", form=form, **_login_ctx())
+
+
+@bp.post("/login")
 def login_post():
     form = LoginForm()
-    store = Store.query.first()
-    store_count = Store.query.count()
-    user_count = User.query.count()
 
     if not form.validate_on_submit():
         flash("Credenciais inválidas", "danger")
-        return render_template("auth_login.html", form=form, store=store, store_count=store_count, user_count=user_count)
-
-    user = User.query.filter(User.email == form.email.data.lower()).first()
-    if not user or not user.check_password(form.password.data) or not user.ativo:
+        return render_template("auth_login.html", form=form, **_login_ctx())
+
+    # lower(email) no SQL casa também linhas gravadas fora do validator (Core,
+    # importações) e usa o índice funcional ix_users_email_lower
+    email = form.email.data.strip().lower()
+    user = User.query.filter(func.lower(User.email) == email).execution_options(todas_lojas=True).first()
+    # Sem usuário também gasta um hash: tempo igual ao de senha errada (evita enumerar e-mails)
+    if not _verify_password(user, form.password.data) or not user.ativo:
         flash("Usuário ou senha incorretos", "danger")
-        return render_template("auth_login.html", form=form, store=store, store_count=store_count, user_count=user_count)
+        return render_template("auth_login.html", form=form, **_login_ctx())
+
+    if user.password_needs_rehash():
+        user.rehash_password(form.password.data)
+        db.session.commit()
 
     login_user(user, remember=form.remember.data)
     flash("Bem-vindo", "success")
@@ -62,7 +118,7 @@ def login_post():
     return redirect(nxt)
 
 
-@bp.get("/auth/logout")
+@bp.get("/logout")
 @login_required
 def logout():
     logout_user()
@@ -0,0 +1,86 @@
+# app/core/choices.py
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+
+from app.extensions import db, invalidate_after_commit
+from app.core.models import Category, Product
+
+# Listas (id, rótulo) dos SelectField, por loja. Mesmo esquema do banner do
+# login: TTL curto + invalidação pelos eventos de mapper deste processo,
+# aplicada no COMMIT (invalidate_after_commit).
+_CHOICES_TTL = 300  # segundos
+_choices_cache: Dict[Tuple[str, int], Tuple[float, list]] = {}
+
+
+def _cached(kind: str, store_id: int, build) -> list:
+    key = (kind, store_id)
+    hit = _choices_cache.get(key)
+    if hit and time.monotonic() - hit[0] < _CHOICES_TTL:
+        return hit[1]
+    value = build()
+    _choices_cache[key] = (time.monotonic(), value)
+    return value
+
+
+def product_choices(store_id: int) -> List[Tuple[int, str]]:
+    """Produtos ativos para o PDV/compras: `(id, "nome [ean]")`, no máx. 500."""
+    def build():
+        rows = db.session.execute(
+            select(Product.id, Product.nome, Product.ean)
+            .where(Product.store_id == store_id, Product.deleted.is_(False), Product.ativo.is_(True))
+            .order_by(Product.nome)
+            .limit(500)
+        )
+        return [(r.id, f"{r.nome} [{r.ean or 'sem EAN'}]") for r in rows]
+    return _cached("product", store_id, build)
+
+
+def category_choices(store_id: int) -> List[Tuple[str, str]]:
+    """Categorias ativas com o placeholder vazio na frente (ProductForm)."""
+    def build():
+        rows = db.session.execute(
+            select(Category.id, Category.nome)
+            .where(Category.store_id == store_id, Category.ativo.is_(True))
+            .order_by(Category.nome)
+        )
+        return [("", "Selecione...")] + [(str(r.id), r.nome) for r in rows]
+    return _cached("category", store_id, build)
+
+
+def _drop_choices(kind: str, store_id: int) -> None:
+    _choices_cache.pop((kind, store_id), None)
+
+
+def invalidate_choices(kind: str, store_id: int) -> None:
+    """Para escritas em lote via Core (insert/update), que não disparam eventos de mapper.
+    Chamar antes do commit: a entrada sai quando a transação de db.session termina."""
+    invalidate_after_commit(db.session, _drop_choices, kind, store_id)
+
+
+def _invalidate(kind: str, attrs=None):
+    def listener(_mapper, _conn, target):
+        # UPDATE só invalida se mudou algo do rótulo/filtro: o espelho de estoque
+        # (stock_qtd, custo_atual) é gravado em toda venda e não muda a lista
+        if attrs is not None:
+            st = inspect(target).attrs
+            if not any(st[a].history.has_changes() for a in attrs):
+                return
+        invalidate_after_commit(object_session(target), _drop_choices, kind, target.store_id)
+    return listener
+
+
+# Colunas que product_choices/category_choices leem
+_LABEL_ATTRS = {
+    "product": ("nome", "ean", "ativo", "deleted", "store_id"),
+    "category": ("nome", "ativo", "store_id"),
+}
+
+for _model, _kind in ((Product, "product"), (Category, "category")):
+    for _evt in ("after_insert", "after_delete"):
+        event.listen(_model, _evt, _invalidate(_kind))
+    event.listen(_model, "after_update", _invalidate(_kind, _LABEL_ATTRS[_kind]))
@@ -0,0 +1,55 @@
+# app/core/forms/__init__.py
+"""
+Forms da aplicação, divididos por área e carregados sob demanda (PEP 562).
+
+`from app.core.forms import LoginForm` importa só `forms/auth.py`; os demais
+módulos (e o FormMeta de cada classe) ficam para quando forem usados.
+"""
+from __future__ import annotations
+
+from importlib import import_module
+
+_FORM_MODULES = {
+    # auth
+    "LoginForm": "auth",
+    "StoreForm": "auth",
+    "UserCreateForm": "auth",
+    "UserEditForm": "auth",
+    # catálogo
+    "SearchForm": "catalog",
+    "CategoryForm": "catalog",
+    "ProductForm": "catalog",
+    "SupplierForm": "catalog",
+    "CustomerForm": "catalog",
+    "PromoForm": "catalog",
+    # estoque e compras
+    "InventorySessionForm": "stock",
+    "InventoryCountForm": "stock",
+    "PurchaseForm": "stock",
+    "PurchaseBulkForm": "stock",
+    "PurchaseItemForm": "stock",
+    # caixa e PDV
+    "CashOpenForm": "pos",
+    "CashCloseForm": "pos",
+    "SaleOpenForm": "pos",
+    "SaleAddItemForm": "pos",
+    "SalePaymentForm": "pos",
+    "SaleCancelForm": "pos",
+    # admin
+    "CsvImportForm": "admin",
+}
+
+__all__ = sorted(_FORM_MODULES)
+
+
+def __getattr__(name: str):
+    mod = _FORM_MODULES.get(name)
+    if mod is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{mod}", __name__), name)
+    globals()[name] = value  # próximas buscas não passam mais por aqui
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
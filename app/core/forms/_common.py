@@ -0,0 +1,75 @@
+# app/core/forms/_common.py
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from wtforms import DateField
+from wtforms.validators import DataRequired, Optional as Opt
+
+# ========================
+# Helpers
+# ========================
+
+# Decimal é imutável: os zeros usados como default/fallback são compartilhados
+_ZERO2 = Decimal("0.00")
+_ZERO4 = Decimal("0.0000")
+
+# Validators sem estado: uma instância compartilhada por todos os campos
+_REQUIRED = DataRequired()
+_OPTIONAL = Opt()
+
+# Choices fixas compartilhadas entre os forms (mesma tupla em todas as instâncias)
+_ROLE_CHOICES = (
+    ("admin", "Administrador"),
+    ("gerente", "Gerente"),
+    ("estoquista", "Estoquista"),
+    ("operador", "Operador"),
+)
+_PAYMENT_CHOICES = (
+    ("dinheiro", "Dinheiro"),
+    ("cartao", "Cartão"),
+    ("pix", "PIX"),
+    ("misto", "Misto"),
+)
+# Mesmos valores do ck_products_unidade
+_UNIDADE_CHOICES = (
+    ("UN", "Unidade"),
+    ("KG", "Quilo"),
+    ("L", "Litro"),
+)
+
+def _to_int_or_none(v):
+    """Coerce seguro para SelectField com placeholder vazio."""
+    if not v:  # "" e None (ids nunca são 0)
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_decimal_or_zero(s: str | None, places: int = 2) -> Decimal:
+    zero = _ZERO2 if places == 2 else _ZERO4
+    if not s:
+        return zero
+    s = str(s).replace(",", ".")
+    try:
+        return Decimal(s)
+    except Exception:
+        return zero
+
+
+class _IsoDateField(DateField):
+    """DateField "%Y-%m-%d" (o que o <input type=date> envia) sem passar pelo strptime."""
+
+    def process_formdata(self, valuelist):
+        s = valuelist[0] if valuelist else ""
+        if len(s) == 10 and s[4] == "-" and s[7] == "-" and self.format == ["%Y-%m-%d"]:
+            try:
+                self.data = date.fromisoformat(s)
+                return
+            except ValueError:
+                pass
+        # Qualquer outro formato/erro segue o caminho (e as mensagens) do WTForms
+        super().process_formdata(valuelist)
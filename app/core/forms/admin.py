@@ -0,0 +1,22 @@
+# app/core/forms/admin.py
+from __future__ import annotations
+
+from flask_wtf import FlaskForm
+from wtforms import SubmitField
+
+from ._common import _REQUIRED
+# se quiser upload CSV simples no admin
+try:
+    from flask_wtf.file import FileField, FileAllowed
+    _HAS_FILE = True
+except Exception:
+    _HAS_FILE = False
+
+# ========================
+# Utilidades de admin
+# ========================
+
+class CsvImportForm(FlaskForm):
+    if _HAS_FILE:
+        file = FileField("Arquivo CSV", validators=[_REQUIRED, FileAllowed(["csv"], "Apenas CSV")])
+    submit = SubmitField("Importar")
@@ -0,0 +1,50 @@
+# app/core/forms/auth.py
+from __future__ import annotations
+
+from flask_wtf import FlaskForm
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField
+from wtforms.validators import Length, Email
+
+from ._common import _REQUIRED, _OPTIONAL, _ROLE_CHOICES
+
+# ========================
+# Auth
+# ========================
+
+class LoginForm(FlaskForm):
+    email = StringField("E-mail", validators=[_REQUIRED, Email(), Length(max=180)])
+    password = PasswordField("Senha", validators=[_REQUIRED, Length(min=6, max=72)])
+    remember = BooleanField("Manter conectado", default=False)
+    submit = SubmitField("Entrar")
+
+# ========================
+# Empresa e Usuários
+# ========================
+
+class StoreForm(FlaskForm):
+    nome = StringField("Nome da empresa", validators=[_REQUIRED, Length(max=120)])
+    cnpj = StringField("CNPJ", validators=[_OPTIONAL, Length(max=18)])
+    ie = StringField("IE", validators=[_OPTIONAL, Length(max=32)])
+    uf = StringField("UF", validators=[_OPTIONAL, Length(max=2)])
+    cidade = StringField("Cidade", validators=[_OPTIONAL, Length(max=80)])
+    timezone = StringField("Timezone", validators=[_REQUIRED, Length(max=40)], default="America/Sao_Paulo")
+    ativo = BooleanField("Ativa", default=True)
+    submit = SubmitField("Salvar")
+
+
+class UserCreateForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=120)])
+    email = StringField("E-mail", validators=[_REQUIRED, Email(), Length(max=180)])
+    role = SelectField("Perfil", choices=_ROLE_CHOICES, validators=[_REQUIRED])
+    senha = PasswordField("Senha", validators=[_REQUIRED, Length(min=6, max=72)])
+    ativo = BooleanField("Ativo", default=True)
+    submit = SubmitField("Criar")
+
+
+class UserEditForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=120)])
+    email = StringField("E-mail", validators=[_REQUIRED, Email(), Length(max=180)])
+    role = SelectField("Perfil", choices=_ROLE_CHOICES, validators=[_REQUIRED])
+    nova_senha = PasswordField("Nova senha", validators=[_OPTIONAL, Length(min=6, max=72)])
+    ativo = BooleanField("Ativo", default=True)
+    submit = SubmitField("Salvar")
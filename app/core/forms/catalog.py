@@ -0,0 +1,106 @@
+# app/core/forms/catalog.py
+from __future__ import annotations
+
+from flask_wtf import FlaskForm
+from wtforms import (
+    StringField, BooleanField, SubmitField, DecimalField, SelectField,
+    IntegerField, TextAreaField
+)
+from wtforms.validators import Length, Email, NumberRange, ValidationError
+
+from app.core.models import VALID_EAN_LENS, normalize_ean
+from ._common import _REQUIRED, _OPTIONAL, _UNIDADE_CHOICES, _IsoDateField, _to_int_or_none
+
+# ========================
+# Busca genérica
+# ========================
+
+class SearchForm(FlaskForm):
+    q = StringField("Buscar", validators=[_OPTIONAL, Length(max=200)])
+    submit = SubmitField("Buscar")
+
+# ========================
+# Categorias
+# ========================
+
+class CategoryForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=120)])
+    markup_padrao = DecimalField("Markup padrão (%)", places=2, rounding=None,
+                                 validators=[_OPTIONAL, NumberRange(min=0)])
+    ativo = BooleanField("Ativa", default=True)
+    submit = SubmitField("Salvar")
+
+# ========================
+# Produtos
+# ========================
+
+class ProductForm(FlaskForm):
+    nome = StringField("Produto", validators=[_REQUIRED, Length(max=200)])
+    sku = StringField("Código interno (opcional)", validators=[_OPTIONAL, Length(max=60)])
+    ean = StringField("Código de barras (opcional)", validators=[_OPTIONAL, Length(max=20)])
+    categoria_id = SelectField("Categoria", coerce=_to_int_or_none, validators=[_OPTIONAL], default=None)
+    unidade = SelectField("Unidade de venda", choices=_UNIDADE_CHOICES, validators=[_REQUIRED])
+    ncm = StringField("NCM (opcional)", validators=[_OPTIONAL, Length(max=10)])
+    cest = StringField("CEST (opcional)", validators=[_OPTIONAL, Length(max=10)])
+    custo_atual = DecimalField("Preço de compra", places=2, rounding=None, validators=[_OPTIONAL, NumberRange(min=0)])
+    preco_venda = DecimalField("Preço de venda", places=2, rounding=None, validators=[_OPTIONAL, NumberRange(min=0)])
+    margem_alvo = DecimalField("Lucro desejado (%) (opcional)", places=2, rounding=None, validators=[_OPTIONAL, NumberRange(min=0)])
+    estoque_minimo = DecimalField("Avisar quando tiver menos que", places=4, rounding=None, validators=[_OPTIONAL, NumberRange(min=0)])
+    ponto_pedido = DecimalField("Repor quando chegar em", places=4, rounding=None, validators=[_OPTIONAL, NumberRange(min=0)])
+    foto_url = StringField("Foto (link)", validators=[_OPTIONAL, Length(max=255)])
+    ativo = BooleanField("Produto ativo", default=True)
+    submit = SubmitField("Salvar")
+
+    def validate_ean(self, field):
+        txt = (field.data or "").strip()
+        if not txt:
+            return
+        # mesma normalização (e cache) usada pelo validator do Product
+        digits = normalize_ean(txt)
+        if digits is None:
+            # se a pessoa digitou só letras/espaços, trate como vazio
+            field.data = ""
+            return
+        if len(digits) not in VALID_EAN_LENS:
+            raise ValidationError("Código de barras deve ter 8, 12, 13 ou 14 números.")
+        # normaliza para só dígitos
+        field.data = digits
+
+# ========================
+# Fornecedores e Clientes
+# ========================
+
+class SupplierForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=180)])
+    cnpj = StringField("CNPJ", validators=[_OPTIONAL, Length(max=18)])
+    ie = StringField("IE", validators=[_OPTIONAL, Length(max=32)])
+    contato = StringField("Contato", validators=[_OPTIONAL, Length(max=120)])
+    telefone = StringField("Telefone", validators=[_OPTIONAL, Length(max=40)])
+    email = StringField("E-mail", validators=[_OPTIONAL, Email(), Length(max=180)])
+    prazo_dias = IntegerField("Prazo (dias)", validators=[_OPTIONAL, NumberRange(min=0)], default=0)
+    ativo = BooleanField("Ativo", default=True)
+    submit = SubmitField("Salvar")
+
+
+class CustomerForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=180)])
+    cpf = StringField("CPF", validators=[_OPTIONAL, Length(max=14)])
+    telefone = StringField("Telefone", validators=[_OPTIONAL, Length(max=40)])
+    email = StringField("E-mail", validators=[_OPTIONAL, Email(), Length(max=180)])
+    pontos = IntegerField("Pontos", validators=[_OPTIONAL, NumberRange(min=0)], default=0)
+    ativo = BooleanField("Ativo", default=True)
+    submit = SubmitField("Salvar")
+
+# ========================
+# Promoções
+# ========================
+
+class PromoForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=120)])
+    # a regra é um JSON na model, aqui mantemos um campo de texto para edição rápida
+    regra_json = TextAreaField("Regra (JSON)", validators=[_REQUIRED, Length(max=2000)])
+    validade_ini = _IsoDateField("Validade inicial", validators=[_REQUIRED], format="%Y-%m-%d")
+    validade_fim = _IsoDateField("Validade final", validators=[_OPTIONAL], format="%Y-%m-%d")
+    prioridade = IntegerField("Prioridade", validators=[_OPTIONAL, NumberRange(min=0)], default=100)
+    ativa = BooleanField("Ativa", default=True)
+    submit = SubmitField("Salvar")
@@ -0,0 +1,57 @@
+# app/core/forms/pos.py
+from __future__ import annotations
+
+from flask_wtf import FlaskForm
+from wtforms import StringField, BooleanField, SubmitField, DecimalField, SelectField
+from wtforms.validators import InputRequired, Length, NumberRange
+
+from ._common import _REQUIRED, _OPTIONAL, _ZERO2, _PAYMENT_CHOICES, _to_int_or_none
+
+# ========================
+# Caixa
+# ========================
+
+class CashOpenForm(FlaskForm):
+    nome = StringField("Nome do caixa", validators=[_REQUIRED, Length(max=60)])
+    saldo_abertura = DecimalField("Saldo de abertura", places=2, rounding=None,
+                                  validators=[_OPTIONAL, NumberRange(min=0)], default=_ZERO2)
+    submit = SubmitField("Abrir caixa")
+
+
+class CashCloseForm(FlaskForm):
+    saldo_fechamento = DecimalField("Saldo de fechamento", places=2, rounding=None,
+                                    validators=[_OPTIONAL, NumberRange(min=0)], default=_ZERO2)
+    submit = SubmitField("Fechar caixa")
+
+# ========================
+# PDV / Vendas
+# ========================
+
+class SaleOpenForm(FlaskForm):
+    customer_id = SelectField("Cliente", coerce=_to_int_or_none, validators=[_OPTIONAL], default=None)
+    submit = SubmitField("Abrir venda")
+
+
+class SaleAddItemForm(FlaskForm):
+    # choices vêm só de ids válidos (sem placeholder), então int basta
+    product_id = SelectField("Produto", coerce=int, validators=[_REQUIRED])
+    qtd = DecimalField("Quantidade", places=4, rounding=None,
+                       validators=[_REQUIRED, NumberRange(min=0.0001)])
+    preco_unit = DecimalField("Preço unitário", places=2, rounding=None,
+                              validators=[_OPTIONAL, NumberRange(min=0)])
+    desconto = DecimalField("Desconto (R$)", places=2, rounding=None,
+                            validators=[_OPTIONAL, NumberRange(min=0)], default=_ZERO2)
+    submit = SubmitField("Adicionar")
+
+
+class SalePaymentForm(FlaskForm):
+    pagamento = SelectField("Forma de pagamento", choices=_PAYMENT_CHOICES, validators=[_REQUIRED])
+    valor_recebido = DecimalField("Valor recebido (R$)", places=2, rounding=None,
+                                  validators=[_REQUIRED, NumberRange(min=0)])
+    submit = SubmitField("Concluir venda")
+
+
+class SaleCancelForm(FlaskForm):
+    motivo = StringField("Motivo", validators=[_OPTIONAL, Length(max=200)])
+    confirmar = BooleanField("Confirmo o cancelamento", validators=[InputRequired()])
+    submit = SubmitField("Cancelar venda")
@@ -0,0 +1,82 @@
+# app/core/forms/stock.py
+from __future__ import annotations
+
+import json
+
+from flask_wtf import FlaskForm
+from wtforms import StringField, BooleanField, SubmitField, DecimalField, SelectField, HiddenField
+from wtforms.validators import Length, NumberRange, ValidationError
+
+from app.core.models import parse_decimal
+
+from ._common import _REQUIRED, _OPTIONAL, _ZERO2, _IsoDateField, _to_int_or_none
+
+# ========================
+# Inventário
+# ========================
+
+class InventorySessionForm(FlaskForm):
+    nome = StringField("Nome", validators=[_REQUIRED, Length(max=120)])
+    setor = StringField("Setor", validators=[_OPTIONAL, Length(max=120)])
+    aberta = BooleanField("Aberta", default=True)
+    submit = SubmitField("Salvar")
+
+
+class InventoryCountForm(FlaskForm):
+    session_id = SelectField("Sessão", coerce=_to_int_or_none, validators=[_REQUIRED])
+    product_id = SelectField("Produto", coerce=_to_int_or_none, validators=[_REQUIRED])
+    qtd_contada = DecimalField("Quantidade contada", places=4, rounding=None,
+                               validators=[_REQUIRED, NumberRange(min=0)])
+    submit = SubmitField("Lançar contagem")
+
+# ========================
+# Compras
+# ========================
+
+class PurchaseForm(FlaskForm):
+    supplier_id = SelectField("Fornecedor", coerce=_to_int_or_none, validators=[_REQUIRED])
+    previsto_para = _IsoDateField("Previsto para", validators=[_OPTIONAL], format="%Y-%m-%d")
+    submit = SubmitField("Salvar")
+
+
+class PurchaseBulkForm(PurchaseForm):
+    """
+    Pedido com todos os itens num campo só (montado pelo JS da tela):
+    `[{"product_id": 1, "qtd": "2", "custo": "10,50", "desconto": "0"}, ...]`.
+    Um json.loads por POST no lugar de um subform WTForms por item; depois de
+    validar, `form.itens` tem as tuplas `(product_id, qtd, custo, desconto)`.
+    """
+    itens_json = HiddenField("Itens", validators=[_REQUIRED])
+
+    def validate_itens_json(self, field):
+        try:
+            raw = json.loads(field.data)
+        except ValueError:
+            raise ValidationError("Itens inválidos")
+        if not isinstance(raw, list) or not raw:
+            raise ValidationError("Informe ao menos um item")
+
+        itens = []
+        for n, it in enumerate(raw, 1):
+            if not isinstance(it, dict):
+                raise ValidationError(f"Item {n} inválido")
+            pid = _to_int_or_none(it.get("product_id"))
+            qtd = parse_decimal(it.get("qtd"))
+            custo = parse_decimal(it.get("custo"))
+            desconto = parse_decimal(it.get("desconto")) if it.get("desconto") not in (None, "") else _ZERO2
+            if pid is None or qtd is None or qtd <= 0 or custo is None or custo < 0 or desconto is None or desconto < 0:
+                raise ValidationError(f"Item {n}: produto, quantidade ou custo inválido")
+            itens.append((pid, qtd, custo, desconto))
+        self.itens = itens
+
+
+class PurchaseItemForm(FlaskForm):
+    # choices vêm só de ids válidos (sem placeholder), então int basta
+    product_id = SelectField("Produto", coerce=int, validators=[_REQUIRED])
+    qtd = DecimalField("Quantidade", places=4, rounding=None,
+                       validators=[_REQUIRED, NumberRange(min=0.0001)])
+    custo = DecimalField("Custo", places=2, rounding=None,
+                         validators=[_REQUIRED, NumberRange(min=0)])
+    desconto = DecimalField("Desconto (R$)", places=2, rounding=None,
+                            validators=[_OPTIONAL, NumberRange(min=0)], default=_ZERO2)
+    submit = SubmitField("Adicionar item")
@@ -0,0 +1,99 @@
+# app/core/jobs.py
+from __future__ import annotations
+
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import Dict, Optional
+
+from flask import current_app
+
+# Estado dos jobs do job_pool (import/export de CSV) em arquivos num diretório
+# comum (JOBS_DIR, padrão instance/jobs): qualquer worker responde o status e
+# serve o download, não só o que recebeu o request. Com mais de uma máquina o
+# JOBS_DIR precisa ser um volume compartilhado. Cada job é <job_id>.json mais
+# os arquivos dele (<job_id>.<ext>); o que passar de JOBS_TTL_SECONDS sem
+# alteração é apagado na criação do próximo job.
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _jobs_dir() -> str:
+    d = current_app.config.get("JOBS_DIR") or os.path.join(current_app.instance_path, "jobs")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def _ttl() -> int:
+    return current_app.config.get("JOBS_TTL_SECONDS", 3600)
+
+
+def job_file(job_id: str, ext: str) -> str:
+    return os.path.join(_jobs_dir(), f"{job_id}.{ext}")
+
+
+def _gravar(job_id: str, job: Dict[str, object]) -> None:
+    # tmp + os.replace: quem lê nunca vê o JSON pela metade
+    d = _jobs_dir()
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(job, fh)
+    os.replace(tmp, os.path.join(d, f"{job_id}.json"))
+
+
+def _prune() -> None:
+    d = _jobs_dir()
+    limite = time.time() - _ttl()
+    for nome in os.listdir(d):
+        path = os.path.join(d, nome)
+        try:
+            if os.path.getmtime(path) < limite:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # outro worker já apagou
+
+
+def create_job(kind: str, **data) -> str:
+    _prune()
+    job_id = uuid.uuid4().hex
+    _gravar(job_id, {"kind": kind, **data})
+    return job_id
+
+
+def get_job(job_id: str, kind: str) -> Optional[Dict[str, object]]:
+    # job_id vem da URL e vira nome de arquivo: só o formato do uuid4().hex
+    if not _JOB_ID.fullmatch(job_id):
+        return None
+    path = job_file(job_id, "json")
+    try:
+        if os.path.getmtime(path) < time.time() - _ttl():
+            return None
+        with open(path, encoding="utf-8") as fh:
+            job = json.load(fh)
+    except FileNotFoundError:
+        return None
+    return job if job.get("kind") == kind else None
+
+
+def update_job(job_id: str, **changes) -> None:
+    # Só a thread do job escreve depois da criação, então não há corrida aqui
+    try:
+        with open(job_file(job_id, "json"), encoding="utf-8") as fh:
+            job = json.load(fh)
+    except FileNotFoundError:
+        return  # expirou (ou foi baixado) no meio do caminho
+    job.update(changes)
+    _gravar(job_id, job)
+
+
+def remove_job(job_id: str) -> None:
+    d = _jobs_dir()
+    for nome in os.listdir(d):
+        if nome.startswith(job_id + "."):
+            try:
+                os.remove(os.path.join(d, nome))
+            except FileNotFoundError:
+                pass
@@ -1,18 +1,26 @@
 # app/core/models.py
 from __future__ import annotations
 
+import hashlib
 import os
 import re
 from datetime import datetime
+from functools import lru_cache
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Optional
 
+from flask import g, has_request_context
 from sqlalchemy import (
-    CheckConstraint, Column, Integer, BigInteger, String, DateTime,
-    Boolean, ForeignKey, UniqueConstraint, Numeric, Enum, JSON, Index, event,
-    func
+    CheckConstraint, Column, Integer, BigInteger, Identity, String, DateTime,
+    Boolean, ForeignKey, UniqueConstraint, Numeric, Enum, JSON, Index, DDL, event,
+    func, select, text
 )
-from sqlalchemy.orm import relationship, backref, validates
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import (
+    deferred, load_only, relationship, backref, validates, with_loader_criteria,
+)
+from sqlalchemy.orm.attributes import instance_state
 from werkzeug.security import generate_password_hash as _wzh, check_password_hash as _wzc
 
 from app.extensions import db  # type: ignore
@@ -24,26 +32,118 @@ from app.extensions import db  # type: ignore
 
 MONEY = Numeric(12, 2)   # 999.999.999,99 máx
 QTD = Numeric(14, 4)     # quantidades com 4 casas
+# PK das tabelas só de append (stock_moves, audit_logs): BIGINT IDENTITY com cache
+# de 100 valores por sessão no PostgreSQL. No SQLite vira INTEGER, o único tipo que
+# é alias do rowid e autoincrementa (BIGINT PRIMARY KEY lá não gera id).
+BIG_ID = BigInteger().with_variant(Integer(), "sqlite")
+# JSONB no PostgreSQL, JSON nos demais; None vira NULL do SQL (não o literal "null")
+JSON_DOC = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
+# Quanta/zeros fixos: Decimal é imutável, não precisa recriar a cada conversão
+_CENT = Decimal("0.01")
+_QTD_STEP = Decimal("0.0001")
+_ZERO_MONEY = Decimal("0.00")
+_ZERO_QTD = Decimal("0.0000")
+
+def _money_from_decimal(v: Decimal) -> Decimal:
+    # Já com 2 casas (vindo do banco/DecimalField): devolve sem quantize
+    return v if v.as_tuple().exponent == -2 else v.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+def _qtd_from_decimal(v: Decimal) -> Decimal:
+    return v if v.as_tuple().exponent == -4 else v.quantize(_QTD_STEP, rounding=ROUND_HALF_UP)
+
+# Despacho pelo tipo exato (um dict lookup no lugar da cadeia de isinstance);
+# tipos fora da tabela (float, str, bool, subclasses) seguem pelo str()
+_MONEY_BY_TYPE = {
+    type(None): lambda v: _ZERO_MONEY,
+    Decimal: _money_from_decimal,
+    int: lambda v: Decimal(v).quantize(_CENT),
+}
+_QTD_BY_TYPE = {
+    type(None): lambda v: _ZERO_QTD,
+    Decimal: _qtd_from_decimal,
+    int: lambda v: Decimal(v).quantize(_QTD_STEP),
+}
 
 def _as_money(value) -> Decimal:
-    if value is None:
-        return Decimal("0.00")
-    if isinstance(value, Decimal):
-        return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    return Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    conv = _MONEY_BY_TYPE.get(type(value))
+    if conv is not None:
+        return conv(value)
+    return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
 
 def _as_qtd(value) -> Decimal:
-    if value is None:
-        return Decimal("0.0000")
-    if isinstance(value, Decimal):
-        return value.quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
-    return Decimal(str(value)).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+    conv = _QTD_BY_TYPE.get(type(value))
+    if conv is not None:
+        return conv(value)
+    return Decimal(str(value)).quantize(_QTD_STEP, rounding=ROUND_HALF_UP)
+
+# Ponto fixo em int para as contas quentes: centavos (2 casas) e décimos de
+# milésimo (4 casas). Decimal só na entrada e na saída.
+def _to_cents(value) -> int:
+    return int(_as_money(value).scaleb(2))
+
+def _to_qtd_units(value) -> int:
+    return int(_as_qtd(value).scaleb(4))
+
+def _from_cents(i: int) -> Decimal:
+    return Decimal(i).scaleb(-2)
+
+def _div_half_up(num: int, den: int) -> int:
+    # Arredondamento ROUND_HALF_UP para num >= 0, den > 0 (mesmo do quantize)
+    return (2 * num + den) // (2 * den)
+
+# "1.234,56" -> "1234.56" e "1,234.56" -> "1234.56" num único translate
+_DEC_COMMA = str.maketrans({",": ".", ".": None})
+_DEC_DOT = str.maketrans({",": None})
+# Número que o Decimal aceita (sem inf/nan): texto inválido sai num fullmatch
+# falho em C, sem montar e capturar a exceção do Decimal
+_DEC_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+def parse_decimal(txt) -> Optional[Decimal]:
+    """Texto com vírgula ou ponto decimal (com ou sem milhar) -> Decimal; None se inválido."""
+    if txt is None:
+        return None
+    s = str(txt).strip()
+    if not s:
+        return None
+    # O separador que aparece por último é o decimal; o outro só agrupa milhar
+    s = s.translate(_DEC_COMMA if s.rfind(",") > s.rfind(".") else _DEC_DOT)
+    return Decimal(s) if _DEC_RE.fullmatch(s) else None
+
+_NON_DIGIT = re.compile(r"\D+")
+# Tabela de str.translate que apaga todo ASCII que não é dígito (roda em C)
+_DROP_ASCII_NON_DIGITS = str.maketrans("", "", "".join(chr(c) for c in range(128) if not chr(c).isdigit()))
+VALID_EAN_LENS = frozenset((8, 12, 13, 14))  # EAN8, UPC-A, EAN13, DUN-14
 
+# PDV e telas de catálogo repetem os mesmos códigos; entradas são strings curtas
+@lru_cache(maxsize=8192)
 def normalize_ean(ean: Optional[str]) -> Optional[str]:
     if not ean:
         return None
-    digits = re.sub(r"\D+", "", ean)
-    return digits or None
+    if ean.isascii():
+        # Leitor de código de barras já manda só dígitos: devolve como veio
+        if ean.isdigit():
+            return ean
+        return ean.translate(_DROP_ASCII_NON_DIGITS) or None
+    return _NON_DIGIT.sub("", ean) or None
+
+# Um algoritmo só (PBKDF2 do Werkzeug, iterações padrão da versão instalada), para
+# o hash falso do login custar o mesmo que o de um usuário real
+def _hash_password(raw: str) -> str:
+    return _wzh(raw, method="pbkdf2:sha256", salt_length=16)
+
+def _verify_password_hash(pwhash: str, raw: str) -> bool:
+    # check_password_hash compara os digests com hmac.compare_digest
+    return _wzc(pwhash, raw)
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    # Hash descartável, gerado uma vez por processo, para equalizar o tempo do login
+    return _hash_password(os.urandom(16).hex())
+
+def _hash_method(pwhash: str) -> str:
+    # "pbkdf2:sha256:1000000$salt$hash" -> "pbkdf2:sha256:1000000"
+    return pwhash.split("$", 1)[0]
 
 class TimestampMixin:
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -60,6 +160,34 @@ class AuditMixin:
     updated_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
 
 
+def _escopo_loja(execute_state):
+    """
+    Rede de segurança multi-loja: todo SELECT do ORM feito num request com
+    usuário logado só enxerga linhas da loja dele (with_loader_criteria em todo
+    StoreScopedMixin, inclusive lazy loads). Lê o usuário já carregado em g, não
+    current_user: o próprio load_user passa por aqui. Fora de request (jobs,
+    CLI) ou com execution_options(todas_lojas=True) não filtra. Os filtros
+    explícitos por store_id continuam valendo: services também rodam sem request.
+    """
+    if not execute_state.is_select or execute_state.execution_options.get("todas_lojas"):
+        return
+    if not has_request_context():
+        return
+    store_id = g.get("_escopo_store_id")
+    if store_id is None:
+        # __dict__: depois de rollback/commit o usuário está expirado e ler o
+        # atributo dispararia um refresh, que voltaria para cá. Lido uma vez por request.
+        store_id = getattr(g.get("_login_user"), "__dict__", {}).get("store_id")
+        if store_id is None:
+            return
+        g._escopo_store_id = store_id
+    execute_state.statement = execute_state.statement.options(with_loader_criteria(
+        StoreScopedMixin, lambda cls: cls.store_id == store_id, include_aliases=True,
+    ))
+
+event.listen(db.session, "do_orm_execute", _escopo_loja)
+
+
 # =============================================================================
 # Enums
 # =============================================================================
@@ -107,30 +235,71 @@ class User(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin):
     ativo = Column(Boolean, default=True, nullable=False)
     ultimo_login = Column(DateTime, nullable=True)
 
-    store = relationship("Store", backref=backref("users", lazy="dynamic"))
+    store = relationship("Store", backref=backref("users", lazy="selectin"))
 
     def set_password(self, raw: str):
         if not raw or len(raw) < 6:
             raise ValueError("Senha muito curta")
-        # PBKDF2 do Werkzeug evita dependência de bcrypt
-        self._password_hash = _wzh(raw, method="pbkdf2:sha256", salt_length=16)
+        self._password_hash = _hash_password(raw)
 
     def check_password(self, raw: str) -> bool:
+        # Dentro de um request o resultado fica em g: conferir a mesma senha de
+        # novo (APIs em lote) não refaz a derivação. Fora de request só calcula.
+        key = None
+        if has_request_context():
+            key = (self._password_hash, hashlib.sha256((raw or "").encode()).digest())
+            memo = g.setdefault("_password_checks", {})
+            if key in memo:
+                return memo[key]
         try:
-            return _wzc(self._password_hash, raw)
+            ok = _verify_password_hash(self._password_hash, raw or "")
         except Exception:
-            return False
+            ok = False
+        if key is not None:
+            memo[key] = ok
+        return ok
+
+    def password_needs_rehash(self) -> bool:
+        """Hash com método/iterações diferentes do atual (e do hash falso do login)."""
+        return _hash_method(self._password_hash) != _hash_method(_dummy_password_hash())
+
+    def rehash_password(self, raw: str) -> None:
+        """Regrava o hash com o algoritmo atual; chamar só após check_password ok."""
+        self._password_hash = _hash_password(raw)
+
+    @staticmethod
+    def check_password_dummy(raw: str) -> bool:
+        """Mesmo custo de check_password, para e-mails inexistentes. Sempre False."""
+        _verify_password_hash(_dummy_password_hash(), raw or "")
+        return False
 
     @validates("email")
     def _val_email(self, key, value):
+        value = (value or "").strip().lower()
         if not value or "@" not in value:
             raise ValueError("Email inválido")
-        return value.lower()
+        return value
 
     def __repr__(self):
         return f"<User {self.id} {self.email} {self.role}>"
 
 
+# Usuário logado: um SELECT por request só com as colunas que as páginas usam
+# (o hash de senha e ultimo_login ficam de fora e só carregam se alguém ler).
+# Sem cache entre requests: desativar ou rebaixar alguém vale no próximo
+# request em qualquer worker.
+_LOGIN_USER_COLS = (User.id, User.store_id, User.nome, User.email, User.role, User.ativo, User.deleted)
+
+
+def load_login_user(user_id: int) -> Optional[User]:
+    # session.get devolve o da identity map (sem SQL) se o request já carregou
+    return db.session.get(
+        User, user_id,
+        options=[load_only(*_LOGIN_USER_COLS)],
+        execution_options={"todas_lojas": True},
+    )
+
+
 class Category(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, AuditMixin):
     __tablename__ = "categories"
 
@@ -160,10 +329,14 @@ class Product(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, Audit
     margem_alvo = Column(Numeric(6, 2), default=Decimal("0.00"), nullable=False)
     estoque_minimo = Column(QTD, default=Decimal("0.0000"), nullable=False)
     ponto_pedido = Column(QTD, default=Decimal("0.0000"), nullable=False)
+    # Espelho de StockItem (loja única = 1:1), gravado junto em aplicar_movimentos_em_lote:
+    # listagem e PDV leem daqui sem JOIN
+    stock_qtd = Column(QTD, default=Decimal("0.0000"), nullable=False)
+    stock_reservado = Column(QTD, default=Decimal("0.0000"), nullable=False)
     foto_url = Column(String(255), nullable=True)
     ativo = Column(Boolean, default=True, nullable=False)
 
-    categoria = relationship("Category", backref=backref("products", lazy="dynamic"))
+    categoria = relationship("Category", backref=backref("products", lazy="raise"))
     stock_item = relationship("StockItem", uselist=False, back_populates="product")
 
     __table_args__ = (
@@ -171,13 +344,16 @@ class Product(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, Audit
         UniqueConstraint("store_id", "sku", name="uq_products_store_sku"),
         CheckConstraint("preco_venda >= 0", name="ck_products_preco_nao_negativo"),
         CheckConstraint("custo_atual >= 0", name="ck_products_custo_nao_negativo"),
+        CheckConstraint("stock_qtd >= 0", name="ck_products_stock_qtd_nao_negativa"),
+        CheckConstraint("estoque_minimo >= 0", name="ck_products_estoque_minimo"),
+        CheckConstraint("ponto_pedido >= 0", name="ck_products_ponto_pedido"),
         CheckConstraint("unidade in ('UN','KG','L')", name="ck_products_unidade"),
     )
 
     @validates("ean")
     def _val_ean(self, key, value):
         v = normalize_ean(value)
-        if v and len(v) not in (8, 12, 13, 14):  # EAN8, UPC-A, EAN13, DUN-14
+        if v and len(v) not in VALID_EAN_LENS:
             raise ValueError("EAN inválido")
         return v
 
@@ -187,6 +363,8 @@ class Product(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, Audit
 
     @validates("estoque_minimo", "ponto_pedido")
     def _val_qtd(self, key, value):
+        # Erro amigável antes do commit (as views tratam ValueError); os
+        # CheckConstraint seguem como garantia do banco para escritas via Core
         v = _as_qtd(value)
         if v < 0:
             raise ValueError("Quantidade negativa")
@@ -251,9 +429,9 @@ class StockItem(db.Model, TimestampMixin, StoreScopedMixin):
 class StockMove(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
     __tablename__ = "stock_moves"
 
-    id = Column(BigInteger, primary_key=True)
+    id = Column(BIG_ID, Identity(always=False, start=1, cache=100), primary_key=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False, index=True)
-    tipo = Column(StockMoveEnum, nullable=False, index=True)
+    tipo = Column(StockMoveEnum, nullable=False)
     qtd = Column(QTD, nullable=False)
     custo = Column(MONEY, nullable=False, default=Decimal("0.00"))
     ref_origem = Column(String(30), nullable=True)  # "purchase", "sale" etc
@@ -266,6 +444,8 @@ class StockMove(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
         CheckConstraint("qtd > 0", name="ck_stock_moves_qtd_positiva"),
         CheckConstraint("custo >= 0", name="ck_stock_moves_custo_nao_negativo"),
         Index("ix_stock_moves_store_product_created", "store_id", "product_id", "created_at"),
+        # entradas de uma compra (receber_compra): só igualdades
+        Index("ix_stock_moves_ref", "store_id", "ref_origem", "ref_id", "tipo"),
     )
 
 
@@ -279,8 +459,9 @@ class Purchase(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, Audi
     total_recebido = Column(MONEY, default=Decimal("0.00"), nullable=False)
     previsto_para = Column(DateTime, nullable=True)
 
-    supplier = relationship("Supplier", backref=backref("purchases", lazy="dynamic"))
-    items = relationship("PurchaseItem", cascade="all, delete-orphan", backref="purchase")
+    supplier = relationship("Supplier", backref=backref("purchases", lazy="raise"))
+    # itens sempre são percorridos juntos: 1 SELECT ... IN para o lote de compras
+    items = relationship("PurchaseItem", cascade="all, delete-orphan", backref="purchase", lazy="selectin")
 
     __table_args__ = (
         CheckConstraint("total_previsto >= 0", name="ck_purchases_previsto"),
@@ -328,7 +509,7 @@ class PriceVersion(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
     valido_de = Column(DateTime, nullable=False, default=datetime.utcnow)
     valido_ate = Column(DateTime, nullable=True)
 
-    product = relationship("Product", backref=backref("prices", lazy="dynamic"))
+    product = relationship("Product", backref=backref("prices", lazy="raise", passive_deletes=True))
 
     __table_args__ = (
         CheckConstraint("preco >= 0", name="ck_price_versions_preco"),
@@ -341,7 +522,7 @@ class Promo(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, AuditMi
 
     id = Column(Integer, primary_key=True)
     nome = Column(String(120), nullable=False)
-    regra_json = Column(JSON, nullable=False)  # exemplo: {"type":"desconto_percentual","value":10}
+    regra_json = Column(JSON_DOC, nullable=False)  # exemplo: {"type":"desconto_percentual","value":10}
     validade_ini = Column(DateTime, nullable=False)
     validade_fim = Column(DateTime, nullable=True)
     prioridade = Column(Integer, default=100, nullable=False)
@@ -380,7 +561,7 @@ class Sale(db.Model, TimestampMixin, SoftDeleteMixin, StoreScopedMixin, AuditMix
 
     caixa = relationship("CashRegister")
     customer = relationship("Customer")
-    items = relationship("SaleItem", cascade="all, delete-orphan", backref="sale")
+    items = relationship("SaleItem", cascade="all, delete-orphan", backref="sale", lazy="selectin")
 
     __table_args__ = (
         CheckConstraint("subtotal >= 0", name="ck_sales_subtotal"),
@@ -410,6 +591,8 @@ class SaleItem(db.Model, TimestampMixin):
         CheckConstraint("preco_unit >= 0", name="ck_sale_items_preco"),
         CheckConstraint("desconto >= 0", name="ck_sale_items_desc"),
         CheckConstraint("total >= 0", name="ck_sale_items_total"),
+        # giro de estoque: produto -> itens -> venda
+        Index("ix_sale_items_product_sale", "product_id", "sale_id", postgresql_include=["qtd", "total"]),
     )
 
     @validates("qtd")
@@ -436,6 +619,8 @@ class Payable(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
 
     __table_args__ = (
         CheckConstraint("valor >= 0", name="ck_payables_valor"),
+        # fluxo de caixa: loja (igualdade) e faixa de vencimento por último
+        Index("ix_payables_store_venc", "store_id", "vencimento", postgresql_include=["status", "valor"]),
     )
 
 
@@ -454,6 +639,7 @@ class Receivable(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
 
     __table_args__ = (
         CheckConstraint("valor >= 0", name="ck_receivables_valor"),
+        Index("ix_receivables_store_venc", "store_id", "vencimento", postgresql_include=["status", "valor"]),
     )
 
 
@@ -490,11 +676,12 @@ class InventoryCount(db.Model, TimestampMixin, StoreScopedMixin, AuditMixin):
 class AuditLog(db.Model, TimestampMixin, StoreScopedMixin):
     __tablename__ = "audit_logs"
 
-    id = Column(BigInteger, primary_key=True)
+    id = Column(BIG_ID, Identity(always=False, start=1, cache=100), primary_key=True)
     entidade = Column(String(60), nullable=False)
     entidade_id = Column(Integer, nullable=True)
     acao = Column(String(60), nullable=False)  # created, updated, deleted, inventory_adjust, price_change
-    payload_json = Column(JSON, nullable=True)
+    # Só a tela de auditoria detalhada precisa do payload: listas não o carregam
+    payload_json = deferred(Column(JSON_DOC, nullable=True))
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     ip = Column(String(45), nullable=True)  # IPv4 ou IPv6
 
@@ -505,66 +692,181 @@ class AuditLog(db.Model, TimestampMixin, StoreScopedMixin):
 # Índices
 # =============================================================================
 
-Index("ix_products_nome_lower", func.lower(Product.nome))
+Index("ix_users_email_lower", func.lower(User.email), unique=True)
+# Lista de usuários por loja, paginada por (created_at, id) decrescente
+Index("ix_users_store_created", User.store_id, User.created_at, User.id)
+# Busca curta por prefixo (lower(nome) LIKE 'q%'): text_pattern_ops deixa o LIKE
+# usar o B-tree no PostgreSQL em qualquer collation
+Index("ix_products_store_nome_lower", Product.store_id, func.lower(Product.nome).label("nome_lower"),
+      postgresql_ops={"nome_lower": "text_pattern_ops"})
+# SKU único por loja sem diferenciar maiúsculas (EAN é só dígitos, não precisa)
+Index("ux_products_store_sku_lower", Product.store_id, func.lower(Product.sku), unique=True)
 Index("ix_suppliers_nome_lower", func.lower(Supplier.nome))
 Index("ix_customers_nome_lower", func.lower(Customer.nome))
+Index("ix_audit_logs_store_entidade_created", AuditLog.store_id, AuditLog.entidade, AuditLog.created_at)
+
+# Cobrindo as consultas quentes (INCLUDE/WHERE só valem no PostgreSQL; nos
+# outros bancos viram índices compostos comuns)
+Index("ix_price_versions_store_product_active", PriceVersion.store_id, PriceVersion.product_id,
+      PriceVersion.valido_de, PriceVersion.valido_ate, postgresql_include=["preco"])
+Index("ix_sales_store_status_created", Sale.store_id, Sale.status, Sale.created_at,
+      postgresql_include=["total"])
+Index("ix_sale_items_sale_product_total", SaleItem.sale_id, SaleItem.product_id,
+      postgresql_include=["qtd", "preco_unit", "total"])
+# Lista de produtos: loja + created_at (o ORDER BY DESC lê o índice de trás para
+# frente) com nome/ean no INCLUDE. A lista padrão só mostra ativos: índice
+# parcial; ?all=1 usa o completo. stock_qtd e preco_venda ficam de fora: mudam a
+# cada venda/reajuste e no INCLUDE cada UPDATE regravaria os dois índices (sem HOT)
+_LIST_INCLUDE = ["nome", "ean"]
+Index("ix_products_store_active_created", Product.store_id, Product.created_at,
+      postgresql_include=_LIST_INCLUDE,
+      postgresql_where=Product.ativo.is_(True), sqlite_where=Product.ativo.is_(True))
+Index("ix_products_store_created", Product.store_id, Product.created_at,
+      postgresql_include=_LIST_INCLUDE)
+# Relatório de estoque baixo
+Index("ix_stock_items_low", StockItem.store_id, StockItem.product_id,
+      postgresql_where=text("quantidade < 10"))
+
+# Busca da lista de produtos (ILIKE '%q%', que B-tree não atende): GIN de
+# trigramas, só no PostgreSQL; nos outros bancos nem são criados
+event.listen(db.metadata, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+Index("ix_products_nome_trgm", Product.nome, postgresql_using="gin",
+      postgresql_ops={"nome": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_products_sku_trgm", Product.sku, postgresql_using="gin",
+      postgresql_ops={"sku": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_products_ean_trgm", Product.ean, postgresql_using="gin",
+      postgresql_ops={"ean": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+# Mesmo esquema para a busca da lista de usuários (nome/e-mail)
+Index("ix_users_nome_trgm", User.nome, postgresql_using="gin",
+      postgresql_ops={"nome": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_users_email_trgm", User.email, postgresql_using="gin",
+      postgresql_ops={"email": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
 
 
 # =============================================================================
 # Regras de estoque
 # =============================================================================
 
-def _apply_stock_move(mapper, connection, target: StockMove):
-    """
-    Aplica o movimento no StockItem de forma atômica.
-    Garante que estoque não fique negativo.
-    """
-    # Busca ou cria o stock_item
-    stock_items = db.session.query(StockItem).filter_by(
-        store_id=target.store_id, product_id=target.product_id
-    ).with_for_update(nowait=False).all()
+_SAIDAS = frozenset(("saida_venda", "saida_ajuste"))
 
-    if stock_items:
-        si = stock_items[0]
+def _insert_ignore(session):
+    """`insert` do dialeto com ON CONFLICT (PostgreSQL/SQLite); None nos demais."""
+    name = session.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
     else:
-        si = StockItem(store_id=target.store_id, product_id=target.product_id, quantidade=Decimal("0.0000"))
-        db.session.add(si)
-        db.session.flush()
-
-    qtd = _as_qtd(target.qtd)
+        return None
+    return insert
 
-    # Tipos de saída
-    if target.tipo in ("saida_venda", "saida_ajuste"):
-        novo = _as_qtd(si.quantidade) - qtd
-        if novo < 0:
-            raise ValueError("Operação causaria estoque negativo")
-        si.quantidade = novo
-    else:
-        # entradas
-        si.quantidade = _as_qtd(si.quantidade) + qtd
-
-    # Atualização do custo médio em entradas de compra
-    if target.tipo == "entrada_compra":
-        prod = db.session.get(Product, target.product_id)
-        if prod:
-            # Cm = (Qt*Cm + q*c) / (Qt + q)
-            Qt = _as_qtd(si.quantidade)
-            q = qtd
-            if Qt > 0:
-                Cm_old = _as_money(prod.custo_atual)
-                c = _as_money(target.custo)
-                Cm_new = ((Cm_old * (Qt - q)) + (c * q)) / (Qt or Decimal("1.0"))
-                prod.custo_atual = _as_money(Cm_new)
-            else:
-                prod.custo_atual = _as_money(target.custo)
-
-event.listen(StockMove, "after_insert", _apply_stock_move)
+def aplicar_movimentos_em_lote(session, moves) -> None:
+    """
+    Aplica um lote de StockMove nos StockItem e no espelho em Product
+    (stock_qtd e, em entradas de compra, custo médio). Um SELECT ... FOR UPDATE
+    para todos os itens de estoque envolvidos e um SELECT dos produtos, em vez de
+    2 consultas por movimento. Garante que estoque não fique negativo.
+    """
+    if not moves:
+        return
+    for m in moves:
+        if m.product_id is None:
+            # StockMove(product=p): o FK só é copiado no flush, depois deste hook
+            prod = getattr(m, "product", None)
+            if prod is None or prod.id is None:
+                raise ValueError("Movimento de estoque sem produto")
+            m.product_id = prod.id
+    pairs = {(m.store_id, m.product_id) for m in moves}
+    product_ids = {pid for _, pid in pairs}
+
+    stock = {
+        (si.store_id, si.product_id): si
+        for si in session.query(StockItem)
+        .filter(StockItem.product_id.in_(product_ids))
+        .with_for_update(nowait=False)
+        if (si.store_id, si.product_id) in pairs
+    }
+    # Dentro do before_flush o SELECT não enxerga StockItem ainda pendente na sessão
+    for o in session.new:
+        if isinstance(o, StockItem) and (o.store_id, o.product_id) in pairs:
+            stock.setdefault((o.store_id, o.product_id), o)
+    missing = pairs - stock.keys()
+    if missing and _insert_ignore(session) is not None:
+        # Cria os que faltam num INSERT ... ON CONFLICT DO NOTHING (outro worker pode
+        # estar criando o mesmo par) e trava a linha que ficou, criada aqui ou lá
+        now = datetime.utcnow()
+        session.execute(
+            _insert_ignore(session)(StockItem.__table__).on_conflict_do_nothing(
+                index_elements=["store_id", "product_id"]),
+            [{"store_id": sid, "product_id": pid, "quantidade": _ZERO_QTD, "reservado": _ZERO_QTD,
+              "created_at": now, "updated_at": now} for sid, pid in missing],
+        )
+        stock.update(
+            ((si.store_id, si.product_id), si)
+            for si in session.query(StockItem)
+            .filter(StockItem.product_id.in_({pid for _, pid in missing}))
+            .with_for_update(nowait=False)
+            if (si.store_id, si.product_id) in missing
+        )
+    produtos = {p.id: p for p in session.query(Product).filter(Product.id.in_(product_ids))}
+
+    for m in moves:
+        key = (m.store_id, m.product_id)
+        si = stock.get(key)
+        if si is None:
+            si = stock[key] = StockItem(store_id=m.store_id, product_id=m.product_id, quantidade=_ZERO_QTD)
+            session.add(si)
+
+        qtd = _as_qtd(m.qtd)
+
+        # Tipos de saída
+        if m.tipo in _SAIDAS:
+            novo = _as_qtd(si.quantidade) - qtd
+            if novo < 0:
+                raise ValueError("Operação causaria estoque negativo")
+            si.quantidade = novo
+        else:
+            # entradas
+            si.quantidade = _as_qtd(si.quantidade) + qtd
+
+        prod = produtos.get(m.product_id)
+        if prod is not None:
+            prod.stock_qtd = si.quantidade
+            prod.stock_reservado = _as_qtd(si.reservado)
+
+        # Atualização do custo médio em entradas de compra
+        if m.tipo == "entrada_compra":
+            if prod:
+                # Cm = (Qt*Cm + q*c) / (Qt + q), em centavos x unidades de qtd
+                qt_i = _to_qtd_units(si.quantidade)
+                if qt_i > 0:
+                    q_i = _to_qtd_units(qtd)
+                    cm_i = _to_cents(prod.custo_atual)
+                    c_i = _to_cents(m.custo)
+                    prod.custo_atual = _from_cents(_div_half_up(cm_i * (qt_i - q_i) + c_i * q_i, qt_i))
+                else:
+                    prod.custo_atual = _as_money(m.custo)
+
+
+def _apply_pending_stock_moves(session, flush_context, instances):
+    # before_flush: o que for alterado aqui entra no mesmo flush (num after_insert
+    # as mudanças em StockItem/Product eram descartadas pelo SQLAlchemy)
+    pending = [o for o in session.new if isinstance(o, StockMove)]
+    if pending:
+        # ordem em que foram adicionados (session.new não garante ordem)
+        pending.sort(key=lambda m: instance_state(m).insert_order)
+        aplicar_movimentos_em_lote(session, pending)
+
+event.listen(db.session, "before_flush", _apply_pending_stock_moves)
 
 
 # =============================================================================
 # Seeds e utilidades
 # =============================================================================
 
+_ADMIN_SEED_LOCK = 0x0A0D11  # chave do advisory lock do ensure_admin
+
 def ensure_admin():
     """
     Cria loja padrão e admin, se não existirem.
@@ -573,22 +875,47 @@ def ensure_admin():
     admin_email = os.getenv("ADMIN_EMAIL", "admin@local").lower()
     admin_pass = os.getenv("ADMIN_PASS", "admin123")
 
-    store = Store.query.filter_by(nome="Loja Padrão").first()
-    if not store:
+    # Boot comum (admin já existe): uma consulta de 1 linha e pronto
+    if db.session.execute(select(User.id).where(func.lower(User.email) == admin_email)).scalar() is not None:
+        return
+    # Primeiro boot com vários workers: só quem pegar o lock semeia (e gasta o hash);
+    # os outros saem. O lock é da transação e solta no commit/rollback.
+    if db.session.get_bind().dialect.name == "postgresql":
+        if not db.session.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _ADMIN_SEED_LOCK}).scalar():
+            db.session.rollback()
+            return
+
+    # Upsert da loja num round trip (ON CONFLICT DO NOTHING RETURNING); se já
+    # existia, o RETURNING volta vazio e cai no SELECT pelo nome (uq_stores_nome)
+    store_id = None
+    insert = _insert_ignore(db.session)
+    if insert is not None:
+        store_id = db.session.execute(
+            insert(Store.__table__)
+            .values(nome="Loja Padrão", ativo=True)
+            .on_conflict_do_nothing(index_elements=["nome"])
+            .returning(Store.__table__.c.id)
+        ).scalar()
+    if store_id is None:
+        store_id = db.session.execute(select(Store.id).where(Store.nome == "Loja Padrão")).scalar()
+    if store_id is None:
         store = Store(nome="Loja Padrão", ativo=True)
         db.session.add(store)
         db.session.flush()
-
-    user = User.query.filter_by(email=admin_email).first()
-    if not user:
-        user = User(
-            store_id=store.id,
-            nome="Administrador",
-            email=admin_email,
-            role="admin",
-            ativo=True,
-        )
-        user.set_password(admin_pass)
-        db.session.add(user)
-
-    db.session.commit()
\ No newline at end of file
+        store_id = store.id
+
+    user = User(
+        store_id=store_id,
+        nome="Administrador",
+        email=admin_email,
+        role="admin",
+        ativo=True,
+    )
+    user.set_password(admin_pass)
+    db.session.add(user)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro worker semeou ao mesmo tempo (uq_stores_nome / email único): nada a fazer
+        db.session.rollback()
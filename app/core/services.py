@@ -1,19 +1,35 @@
 # app/core/services.py
+#
+# Desempenho: perfile antes de otimizar. O custo aqui é ida e volta ao banco e o
+# fsync do commit, não CPU do Python; não há laço numérico para JIT (Numba etc.).
+# O caminho é levar o trabalho para o SQL: agregados (listar_fluxo_caixa,
+# receber_compra), INSERT em lote (criar_movimentos_em_lote,
+# criar_produtos_em_lote) e INSERT ... SELECT / UPDATE em conjunto
+# (conciliar_inventario).
 from __future__ import annotations
 
+import time
 from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+from types import SimpleNamespace
 from datetime import datetime
 from decimal import Decimal
 from typing import Iterable, List, Optional, Tuple, Dict, Any
 
-from flask import current_app
+from flask import current_app, g, has_app_context
+from sqlalchemy import (
+    Date, DateTime, Integer, and_, case, cast, event, exists, func, insert, lambda_stmt, literal, select,
+    type_coerce, update,
+)
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, object_session
+from sqlalchemy.orm.attributes import instance_state
 
-from app.extensions import db
+from app.extensions import db, invalidate_after_commit
+from app.core.choices import invalidate_choices
 from app.core.models import (
-    _as_money, _as_qtd, normalize_ean,
+    MONEY, QTD, _ZERO_MONEY, _ZERO_QTD, _as_money, _as_qtd, normalize_ean, VALID_EAN_LENS, aplicar_movimentos_em_lote, _insert_ignore,
     Store, User, Category, Product, Supplier, Customer,
     StockItem, StockMove, StockMoveEnum,
     Purchase, PurchaseItem, PurchaseStatusEnum,
@@ -35,35 +51,89 @@ def _ensure(cond: bool, msg: str):
     if not cond:
         raise ServiceError(msg)
 
-def _row_to_dict(obj, keys: Iterable[str]) -> Dict[str, Any]:
-    return {k: getattr(obj, k, None) for k in keys}
+def _row_to_dict(obj, keys: Tuple[str, ...]) -> Dict[str, Any]:
+    # Lê do estado já carregado do objeto: chave de relacionamento nunca dispara
+    # lazy load. Colunas expiradas (pós-commit) ou deferred vêm num SELECT só.
+    state = instance_state(obj)
+    d = state.dict
+    cols = state.mapper.column_attrs
+    faltando = [k for k in keys if k not in d and k in cols]
+    if faltando and state.persistent:
+        # no_autoflush: ler o "before" não pode gravar as mudanças pendentes
+        with db.session.no_autoflush:
+            db.session.refresh(obj, attribute_names=faltando)
+    return {k: d.get(k) for k in keys}
+
+_tx_depth: ContextVar[int] = ContextVar("_tx_depth", default=0)
 
 @contextmanager
 def transaction():
+    """
+    Commit único para o bloco. Aninhado (um `with transaction()` dentro de outro)
+    vira SAVEPOINT: erro desfaz só o bloco interno e o COMMIT fica para o externo.
+    """
+    depth = _tx_depth.get()
+    token = _tx_depth.set(depth + 1)
+    sp = db.session.begin_nested() if depth else None
+    # audits enfileirados antes do bloco (ver audit_log); o SAVEPOINT desfeito
+    # leva junto só os que entraram depois
+    n_audits = len(db.session.info.get("pending_audits", ()))
+
+    def rollback():
+        if sp is None:
+            db.session.rollback()
+            return
+        if sp.is_active:
+            sp.rollback()
+        del db.session.info.get("pending_audits", [])[n_audits:]
+
     try:
         yield
-        db.session.commit()
+        if sp is None:
+            db.session.commit()
+        else:
+            sp.commit()
     except IntegrityError as ie:
-        db.session.rollback()
+        rollback()
         raise ServiceError(f"Violação de integridade: {ie.orig}") from ie
     except ServiceError:
-        db.session.rollback()
+        rollback()
         raise
     except Exception as e:
-        db.session.rollback()
+        rollback()
         raise ServiceError(str(e)) from e
+    finally:
+        _tx_depth.reset(token)
 
 def audit_log(store_id: int, entidade: str, entidade_id: Optional[int], acao: str, payload: dict, user: Optional[User]):
-    log = AuditLog(
-        store_id=store_id,
-        entidade=entidade,
-        entidade_id=entidade_id,
-        acao=acao,
-        payload_json=payload or {},
-        user_id=user.id if user else None,
-        ip=None
-    )
-    db.session.add(log)
+    # Só escrita: guarda a linha na sessão e grava tudo num INSERT multi-linha
+    # no commit (_flush_pending_audits), sem objeto ORM por registro
+    now = datetime.utcnow()
+    db.session.info.setdefault("pending_audits", []).append({
+        "store_id": store_id,
+        "entidade": entidade,
+        "entidade_id": entidade_id,
+        "acao": acao,
+        "payload_json": payload or None,
+        "user_id": user.id if user else None,
+        "ip": None,
+        "created_at": now,
+        "updated_at": now,
+    })
+
+def _flush_pending_audits(session):
+    rows = session.info.pop("pending_audits", None)
+    if rows:
+        session.execute(insert(AuditLog), rows)
+
+def _drop_pending_audits(session, transaction):
+    # Fim da transação externa sem commit (rollback/close): o audit da operação
+    # desfeita não deve ir no próximo commit. SAVEPOINT fica a cargo de transaction().
+    if transaction.parent is None:
+        session.info.pop("pending_audits", None)
+
+event.listen(db.session, "before_commit", _flush_pending_audits)
+event.listen(db.session, "after_transaction_end", _drop_pending_audits)
 
 def require_role(user: User, allowed: Iterable[str]):
     if not user or user.deleted or not user.ativo:
@@ -71,6 +141,39 @@ def require_role(user: User, allowed: Iterable[str]):
     if user.role not in allowed and "*" not in allowed:
         raise ServiceError("Permissão negada")
 
+def criar_movimentos_em_lote(store_id: int, rows: Iterable[Dict[str, Any]], user: Optional[User]) -> int:
+    """
+    Grava vários StockMove num INSERT executemany, sem um objeto ORM por linha.
+    Cada row traz product_id, tipo e qtd (custo, ref_origem, ref_id e motivo opcionais).
+    O estoque é aplicado antes, num lote só (aplicar_movimentos_em_lote), já que
+    o before_flush só enxerga StockMove adicionados à sessão.
+    """
+    uid = user.id if user else None
+    agora = datetime.utcnow()
+    lote = []
+    for r in rows:
+        _ensure(r.get("product_id") is not None, "Movimento de estoque sem produto")
+        qtd = _as_qtd(r["qtd"])
+        _ensure(qtd > 0, "Quantidade deve ser positiva")
+        lote.append(dict(
+            store_id=store_id,
+            product_id=r["product_id"],
+            tipo=r["tipo"],
+            qtd=qtd,
+            custo=_as_money(r.get("custo")),
+            ref_origem=r.get("ref_origem"),
+            ref_id=r.get("ref_id"),
+            motivo=r.get("motivo"),
+            created_by_id=uid,
+            created_at=agora,
+            updated_at=agora,
+        ))
+    if not lote:
+        return 0
+    aplicar_movimentos_em_lote(db.session, [SimpleNamespace(**m) for m in lote])
+    db.session.execute(insert(StockMove), lote)
+    return len(lote)
+
 # =============================================================================
 # Produtos e Preços
 # =============================================================================
@@ -118,12 +221,167 @@ def criar_produto(
     db.session.flush()
 
     # Cria o registro de estoque se não existir
-    si = StockItem(store_id=store_id, product_id=p.id, quantidade=_as_qtd(0), reservado=_as_qtd(0))
+    si = StockItem(store_id=store_id, product_id=p.id, quantidade=_ZERO_QTD, reservado=_ZERO_QTD)
     db.session.add(si)
 
-    audit_log(store_id, "Product", p.id, "created", _row_to_dict(p, ["nome", "sku", "ean", "preco_venda"]), created_by)
+    audit_log(store_id, "Product", p.id, "created", _row_to_dict(p, ("nome", "sku", "ean", "preco_venda")), created_by)
     return p
 
+def criar_produtos_em_lote(
+    store_id: int,
+    rows: Iterable[Dict[str, Any]],
+    created_by: Optional[User] = None,
+    origem: str = "manual",
+) -> List[int]:
+    """
+    Cadastro em massa (importação): um INSERT ... RETURNING id para os produtos,
+    um INSERT para os StockItem e um para as PriceVersion de quem tem preço, em vez
+    de um flush por produto.
+    Devolve os ids na mesma ordem de `rows`; registra um audit de resumo.
+    """
+    now = datetime.utcnow()
+    uid = created_by.id if created_by else None
+    prod_rows = [_linha_produto_lote(store_id, r, uid, now) for r in rows]
+    if not prod_rows:
+        return []
+
+    pids = db.session.execute(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True), prod_rows
+    ).scalars().all()
+    db.session.execute(insert(StockItem), [
+        {"store_id": store_id, "product_id": pid, "quantidade": _ZERO_QTD, "reservado": _ZERO_QTD,
+         "created_at": now, "updated_at": now}
+        for pid in pids
+    ])
+    _precos_lote(store_id, pids, prod_rows, origem, uid, now)
+
+    invalidate_choices("product", store_id)
+    audit_log(store_id, "Product", None, "bulk_created", {"count": len(pids), "origem": origem}, created_by)
+    return pids
+
+def _linha_produto_lote(store_id: int, r: Dict[str, Any], uid: Optional[int], now: datetime) -> Dict[str, Any]:
+    # Valida e converte aqui o que os validators do ORM fariam
+    nome = (r.get("nome") or "").strip()
+    _ensure(nome, "Nome do produto obrigatório")
+    ean = normalize_ean(r.get("ean"))
+    _ensure(not ean or len(ean) in VALID_EAN_LENS, f"EAN inválido: {ean}")
+    return {
+        "store_id": store_id,
+        "nome": nome,
+        "sku": (r.get("sku") or "").strip() or None,
+        "ean": ean,
+        "categoria_id": r.get("categoria_id"),
+        "unidade": r.get("unidade") or "UN",
+        "ncm": (r.get("ncm") or "").strip() or None,
+        "cest": (r.get("cest") or "").strip() or None,
+        "custo_atual": _as_money(r.get("custo_atual")),
+        "preco_venda": _as_money(r.get("preco_venda")),
+        "margem_alvo": _as_money(r.get("margem_alvo")),
+        "estoque_minimo": _as_qtd(r.get("estoque_minimo")),
+        "ponto_pedido": _as_qtd(r.get("ponto_pedido")),
+        "ativo": bool(r.get("ativo", True)),
+        "created_by_id": uid,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+def _precos_lote(store_id, pids, prod_rows, origem, uid, now) -> None:
+    precos = [
+        {"store_id": store_id, "product_id": pid, "preco": r["preco_venda"], "origem": origem,
+         "valido_de": now, "created_by_id": uid, "created_at": now, "updated_at": now}
+        for pid, r in zip(pids, prod_rows) if r["preco_venda"] > 0
+    ]
+    if precos:
+        db.session.execute(insert(PriceVersion), precos)
+
+def upsert_disponivel() -> bool:
+    """O banco da sessão tem INSERT ... ON CONFLICT (PostgreSQL/SQLite)?"""
+    return _insert_ignore(db.session) is not None
+
+# Colunas que o upsert por EAN sobrescreve num produto que já existe
+_UPSERT_SET = (
+    "nome", "sku", "categoria_id", "unidade", "ncm", "cest",
+    "custo_atual", "preco_venda", "margem_alvo", "estoque_minimo", "ponto_pedido", "ativo", "updated_at",
+)
+
+def upsert_produtos_por_ean(
+    store_id: int,
+    rows: Iterable[Dict[str, Any]],
+    created_by: Optional[User] = None,
+    origem: str = "manual",
+) -> Tuple[int, int]:
+    """
+    Cria ou atualiza por (store_id, ean) num INSERT ... ON CONFLICT DO UPDATE
+    ... RETURNING, sem SELECT para decidir entre INSERT e UPDATE (nem a janela de
+    corrida entre os dois). Todas as linhas precisam de EAN; repetidas, a última
+    vale. Só com upsert_disponivel(). Devolve (criados, atualizados).
+    """
+    ins = _insert_ignore(db.session)
+    now = datetime.utcnow()
+    uid = created_by.id if created_by else None
+    por_ean = {}
+    for r in rows:
+        linha = _linha_produto_lote(store_id, r, uid, now)
+        _ensure(linha["ean"], "Upsert por EAN exige EAN")
+        por_ean[linha["ean"]] = linha  # um ON CONFLICT não mexe duas vezes na mesma linha
+    if not por_ean:
+        return 0, 0
+    prod_rows = list(por_ean.values())
+
+    # Preço atual dos que já existem: decide a contagem devolvida e quem ganha
+    # PriceVersion (o RETURNING do upsert só enxerga o valor novo)
+    eans = list(por_ean)
+    preco_antes = {}
+    for i in range(0, len(eans), 1000):
+        preco_antes.update(db.session.execute(select(Product.ean, Product.preco_venda).where(
+            Product.store_id == store_id, Product.ean.in_(eans[i:i + 1000]),
+        )).all())
+    existentes = len(preco_antes)
+
+    stmt = ins(Product)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.store_id, Product.ean],
+        # EAN de produto excluído (soft delete) volta ao catálogo com os dados do
+        # lote; sem isso o "atualizado" continuaria invisível nas listas
+        set_={**{k: stmt.excluded[k] for k in _UPSERT_SET}, "deleted": False},
+    ).returning(Product.ean, Product.id)
+    # casa pelo EAN (único na loja), não pela ordem: em upsert a ordem do RETURNING não é garantida
+    id_por_ean = dict(db.session.execute(stmt, prod_rows).all())
+    pids = [id_por_ean[e] for e in por_ean]
+
+    # Produto novo ganha StockItem; quem já tem fica como está
+    db.session.execute(
+        ins(StockItem).on_conflict_do_nothing(index_elements=[StockItem.store_id, StockItem.product_id]),
+        [{"store_id": store_id, "product_id": pid, "quantidade": _ZERO_QTD, "reservado": _ZERO_QTD,
+          "created_at": now, "updated_at": now} for pid in pids],
+    )
+    # PriceVersion só para produto novo ou preço que mudou de fato
+    mudou = [
+        (pid, r) for pid, r in zip(pids, prod_rows)
+        if r["ean"] not in preco_antes or preco_antes[r["ean"]] != r["preco_venda"]
+    ]
+    if mudou:
+        _precos_lote(store_id, *zip(*mudou), origem, uid, now)
+
+    # UPDATE fora do ORM: instâncias carregadas recarregam do banco
+    atualizados = set(pids)
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in atualizados:
+            db.session.expire(obj)
+
+    invalidate_choices("product", store_id)
+    criados = len(pids) - existentes
+    audit_log(store_id, "Product", None, "bulk_upserted",
+              {"criados": criados, "atualizados": existentes, "origem": origem}, created_by)
+    return criados, existentes
+
+_PRODUCT_EDITABLE = frozenset((
+    "nome", "sku", "ean", "categoria_id", "unidade", "ncm", "cest",
+    "estoque_minimo", "ponto_pedido", "margem_alvo", "foto_url", "ativo"
+))
+_PRODUCT_EDITABLE_KEYS = tuple(sorted(_PRODUCT_EDITABLE))  # ordem estável no audit
+_PRODUCT_QTD_FIELDS = frozenset(("estoque_minimo", "ponto_pedido"))
+
 def atualizar_produto(
     product_id: int,
     dados: Dict[str, Any],
@@ -131,29 +389,25 @@ def atualizar_produto(
 ) -> Product:
     p = db.session.get(Product, product_id)
     _ensure(p and not p.deleted, "Produto não encontrado")
-    campos_editaveis = {
-        "nome", "sku", "ean", "categoria_id", "unidade", "ncm", "cest",
-        "estoque_minimo", "ponto_pedido", "margem_alvo", "foto_url", "ativo"
-    }
-    before = _row_to_dict(p, list(campos_editaveis))
-    for k, v in dados.items():
-        if k not in campos_editaveis:
-            continue
-        if k in {"estoque_minimo", "ponto_pedido", "margem_alvo"}:
-            setattr(p, k, _as_qtd(v) if k != "margem_alvo" else Decimal(str(v)))
+    before = _row_to_dict(p, _PRODUCT_EDITABLE_KEYS)
+    for k in _PRODUCT_EDITABLE & dados.keys():
+        v = dados[k]
+        if k in _PRODUCT_QTD_FIELDS:
+            setattr(p, k, _as_qtd(v))
+        elif k == "margem_alvo":
+            setattr(p, k, Decimal(str(v)))
         elif k == "ean":
             setattr(p, k, normalize_ean(v))
         else:
             setattr(p, k, v)
     p.updated_by_id = updated_by.id if updated_by else None
-    audit_log(p.store_id, "Product", p.id, "updated", {"before": before, "after": _row_to_dict(p, list(campos_editaveis))}, updated_by)
+    audit_log(p.store_id, "Product", p.id, "updated", {"before": before, "after": _row_to_dict(p, _PRODUCT_EDITABLE_KEYS)}, updated_by)
     return p
 
 def simular_preco(custo: Decimal, markup_percent: Decimal) -> Decimal:
     custo = _as_money(custo)
     mk = Decimal(str(markup_percent or 0)) / Decimal("100")
-    preco = custo * (Decimal("1.0") + mk)
-    return _as_money(preco)
+    return _as_money(custo * (Decimal("1.0") + mk))
 
 def publicar_preco(store_id: int, product_id: int, preco: Decimal, origem: str = "manual", user: Optional[User] = None) -> PriceVersion:
     preco = _as_money(preco)
@@ -188,7 +442,7 @@ def ajuste_estoque(store_id: int, product_id: int, qtd: Decimal, motivo: str, ti
         product_id=product_id,
         tipo=tipo,
         qtd=qtd,
-        custo=p.custo_atual if tipo == "entrada_ajuste" else Decimal("0.00"),
+        custo=p.custo_atual if tipo == "entrada_ajuste" else _ZERO_MONEY,
         motivo=(motivo or "").strip()[:200],
         created_by_id=user.id if user else None
     )
@@ -209,28 +463,35 @@ class ItemCompraDTO:
 
 def criar_pedido_compra(store_id: int, supplier_id: int, itens: List[ItemCompraDTO], user: Optional[User]) -> Purchase:
     _ensure(len(itens) > 0, "Lista de itens vazia")
-    supplier = db.session.get(Supplier, supplier_id)
-    _ensure(supplier and supplier.store_id == store_id and supplier.ativo, "Fornecedor inválido")
+    # Cabeçalho validado numa ida ao banco: fornecedor ativo da loja e quantos
+    # dos produtos pedidos existem (não excluídos) nela
+    ids = {dto.product_id for dto in itens}
+    fornecedor_ok, n_validos = db.session.execute(select(
+        exists().where(Supplier.id == supplier_id, Supplier.store_id == store_id, Supplier.ativo.is_(True)),
+        select(func.count(Product.id)).where(
+            Product.id.in_(ids), Product.store_id == store_id, Product.deleted.is_(False),
+        ).scalar_subquery(),
+    )).one()
+    _ensure(fornecedor_ok, "Fornecedor inválido")
+    _ensure(n_validos == len(ids), "Produto inválido na compra")
     compra = Purchase(
         store_id=store_id, supplier_id=supplier_id, status="rascunho",
-        total_previsto=Decimal("0.00"), total_recebido=Decimal("0.00"),
+        total_previsto=_ZERO_MONEY, total_recebido=_ZERO_MONEY,
         created_by_id=user.id if user else None
     )
     db.session.add(compra)
-    total = Decimal("0.00")
+    total = _ZERO_MONEY
     for dto in itens:
         qtd = _as_qtd(dto.qtd)
         custo = _as_money(dto.custo)
         desc = _as_money(dto.desconto)
         _ensure(qtd > 0, "Quantidade deve ser positiva")
         _ensure(custo >= 0, "Custo negativo")
-        prod = db.session.get(Product, dto.product_id)
-        _ensure(prod and prod.store_id == store_id and not prod.deleted, "Produto inválido na compra")
         total_item = _as_money(qtd * custo - desc)
-        pci = PurchaseItem(purchase_id=compra.id, product_id=prod.id, qtd=qtd, custo=custo, desconto=desc, total=total_item)
-        db.session.add(pci)
+        # Pela relação: compra.id ainda não existe aqui, o flush preenche purchase_id
+        compra.items.append(PurchaseItem(product_id=dto.product_id, qtd=qtd, custo=custo, desconto=desc, total=total_item))
         total += total_item
-    compra.total_previsto = _as_money(total)
+    compra.total_previsto = total
     audit_log(store_id, "Purchase", None, "created", {"supplier_id": supplier_id, "itens": len(itens), "total_previsto": str(total)}, user)
     return compra
 
@@ -251,39 +512,39 @@ class ItemRecebimentoDTO:
 def receber_compra(compra_id: int, itens: List[ItemRecebimentoDTO], user: Optional[User]) -> Purchase:
     compra = db.session.get(Purchase, compra_id)
     _ensure(compra and compra.status in ("emitida", "parcialmente_recebida"), "Compra não pode ser recebida")
-    itens_map = {i.product_id: i for i in db.session.query(PurchaseItem).filter_by(purchase_id=compra.id).all()}
-    _ensure(len(itens_map) > 0, "Compra sem itens")
-
-    total_receb = compra.total_recebido or Decimal("0.00")
+    # custo por produto e, na mesma ida ao banco, a qtd total pedida (SUM OVER)
+    linhas = db.session.execute(
+        select(PurchaseItem.product_id, PurchaseItem.custo, func.sum(PurchaseItem.qtd).over())
+        .where(PurchaseItem.purchase_id == compra.id)
+    ).all()
+    _ensure(len(linhas) > 0, "Compra sem itens")
+    custos = {pid: custo for pid, custo, _ in linhas}
+    qtd_pedido = linhas[0][2]
+
+    total_receb = compra.total_recebido or _ZERO_MONEY
+    # Recebimentos anteriores da compra (um SUM no banco); os deste somam no loop
+    qtd_recebida = _as_qtd(db.session.execute(
+        select(func.coalesce(func.sum(StockMove.qtd), 0)).where(
+            StockMove.store_id == compra.store_id, StockMove.ref_origem == "purchase",
+            StockMove.ref_id == compra.id, StockMove.tipo == "entrada_compra",
+        )
+    ).scalar())
+    movs = []
     for rec in itens:
-        _ensure(rec.product_id in itens_map, "Produto não pertence ao pedido")
+        _ensure(rec.product_id in custos, "Produto não pertence ao pedido")
         qtd = _as_qtd(rec.qtd)
         _ensure(qtd > 0, "Quantidade deve ser positiva")
-        custo_base = itens_map[rec.product_id].custo
+        custo_base = custos[rec.product_id]
         custo_rec = _as_money(rec.custo if rec.custo is not None else custo_base)
-
-        # Gera movimento de estoque
-        sm = StockMove(
-            store_id=compra.store_id,
-            product_id=rec.product_id,
-            tipo="entrada_compra",
-            qtd=qtd,
-            custo=custo_rec,
-            ref_origem="purchase",
-            ref_id=compra.id,
-            created_by_id=user.id if user else None
-        )
-        db.session.add(sm)
+        movs.append(dict(product_id=rec.product_id, tipo="entrada_compra", qtd=qtd, custo=custo_rec,
+                         ref_origem="purchase", ref_id=compra.id))
         total_receb += _as_money(qtd * custo_rec)
+        qtd_recebida += qtd
+    # Entradas do recebimento (estoque + custo médio) num lote e um INSERT só
+    criar_movimentos_em_lote(compra.store_id, movs, user)
 
     compra.total_recebido = _as_money(total_receb)
     # Atualiza status
-    qtd_pedido = sum((_as_qtd(i.qtd) for i in itens_map.values()), _as_qtd(0))
-    qtd_recebida = _as_qtd(0)
-    # Aproxima por somatório de entradas da compra
-    entradas = db.session.query(StockMove).filter_by(store_id=compra.store_id, ref_origem="purchase", ref_id=compra.id, tipo="entrada_compra").all()
-    for e in entradas:
-        qtd_recebida += _as_qtd(e.qtd)
     if qtd_recebida == 0:
         compra.status = "emitida"
     elif qtd_recebida < qtd_pedido:
@@ -322,44 +583,101 @@ def abrir_venda(store_id: int, caixa_id: Optional[int], user: User) -> Sale:
         store_id=store_id,
         caixa_id=caixa_id,
         status="aberta",
-        subtotal=_as_money(0),
-        desconto=_as_money(0),
-        total=_as_money(0),
+        subtotal=_ZERO_MONEY,
+        desconto=_ZERO_MONEY,
+        total=_ZERO_MONEY,
         created_by_id=user.id
     )
     db.session.add(sale)
     audit_log(store_id, "Sale", None, "created", {}, user)
     return sale
 
-def _preco_com_promos(store_id: int, product: Product, qtd: Decimal) -> Tuple[Decimal, Optional[int], Decimal]:
+# Cache negativo por processo: loja sem promo vigente não consulta de novo por
+# _SEM_PROMO_TTL segundos. Editar qualquer Promo da loja (eventos de mapper)
+# limpa a marca; uma promo agendada que começa a valer espera no máximo o TTL.
+_SEM_PROMO_TTL = 60  # segundos
+_lojas_sem_promo: Dict[int, float] = {}
+
+def promo_vigente(store_id: int, agora: Optional[datetime] = None) -> Optional[Promo]:
+    """
+    Promo ativa de maior prioridade da loja. Dentro de um request/app context
+    fica em g por (loja, minuto): vários itens do mesmo carrinho fazem um SELECT.
+    `agora` deixa o chamador usar um só relógio para a operação inteira.
+    """
+    marca = _lojas_sem_promo.get(store_id)
+    if marca is not None and time.monotonic() - marca < _SEM_PROMO_TTL:
+        return None
+    agora = agora or datetime.utcnow()
+    cache = g.setdefault("_promo_cache", {}) if has_app_context() else None
+    key = (store_id, agora.replace(second=0, microsecond=0))
+    if cache is not None and key in cache:
+        return cache[key]
+    # Roda a cada item bipado: lambda_stmt monta o SELECT uma vez e só troca os binds
+    promo = db.session.scalars(lambda_stmt(lambda: select(Promo).where(
+        Promo.store_id == store_id,
+        Promo.ativa.is_(True),
+        Promo.validade_ini <= agora,
+        (Promo.validade_fim.is_(None)) | (Promo.validade_fim >= agora)
+    ).order_by(Promo.prioridade.asc()).limit(1))).first()
+    if cache is not None:
+        cache[key] = promo
+    if promo is None:
+        _lojas_sem_promo[store_id] = time.monotonic()
+    return promo
+
+def _promo_alterada(_mapper, _conn, target):
+    # no fim da transação, como choices: antes do COMMIT outro request ainda
+    # lê "sem promo" e recoloca a loja no cache negativo
+    invalidate_after_commit(object_session(target), _lojas_sem_promo.pop, target.store_id, None)
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Promo, _evt, _promo_alterada)
+
+_SEM_PROMO = object()
+
+def _preco_com_promos(store_id: int, product: Product, qtd: Decimal, promo=_SEM_PROMO,
+                      agora: Optional[datetime] = None) -> Tuple[Decimal, Optional[int], Decimal]:
     """
     Estratégia simples de promo.
     Retorna: preco_unit_final, promo_id, desconto_total
+    `promo` permite ao chamador buscar a promo uma vez (promo_vigente) para vários itens.
     """
     preco_unit = _as_money(product.preco_venda)
-    desconto_total = _as_money(0)
+    desconto_total = _ZERO_MONEY
     promo_id = None
     if not product.ativo:
-        return preco_unit, None, _as_money(0)
+        return preco_unit, None, _ZERO_MONEY
 
     # Exemplo: aplica promo percentual se existir válida
-    agora = datetime.utcnow()
-    promo = db.session.query(Promo).filter(
-        Promo.store_id == store_id,
-        Promo.ativa.is_(True),
-        Promo.validade_ini <= agora,
-        (Promo.validade_fim.is_(None)) | (Promo.validade_fim >= agora)
-    ).order_by(Promo.prioridade.asc()).first()
+    if promo is _SEM_PROMO:
+        promo = promo_vigente(store_id, agora)
     if promo and isinstance(promo.regra_json, dict):
         r = promo.regra_json
         if r.get("type") == "desconto_percentual":
             perc = Decimal(str(r.get("value", 0)))
-            desconto = (preco_unit * qtd) * (perc / Decimal("100"))
-            desconto_total = _as_money(desconto)
+            desconto_total = _as_money((preco_unit * qtd) * (perc / Decimal("100")))
             promo_id = promo.id
 
     return preco_unit, promo_id, desconto_total
 
+_SALE_TOTAIS = ("subtotal", "desconto", "total")
+
+def _somar_totais_venda(sale: Sale, d_subtotal: Decimal, d_desconto: Decimal, d_total: Decimal) -> None:
+    # UPDATE ... SET total = total + :delta: atômico no banco (dois caixas mexendo
+    # na mesma venda não perdem item) e sem recalcular em Python. Os atributos
+    # expiram para a próxima leitura (ex.: pagar_venda) vir do banco.
+    db.session.execute(
+        update(Sale)
+        .where(Sale.id == sale.id)
+        .values(
+            subtotal=Sale.subtotal + d_subtotal,
+            desconto=Sale.desconto + d_desconto,
+            total=Sale.total + d_total,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(sale, _SALE_TOTAIS)
+
 def adicionar_item_venda(sale_id: int, product_id: int, qtd: Decimal, user: User) -> SaleItem:
     sale = db.session.get(Sale, sale_id)
     _ensure(sale and sale.status == "aberta", "Venda inválida ou não está aberta")
@@ -368,10 +686,13 @@ def adicionar_item_venda(sale_id: int, product_id: int, qtd: Decimal, user: User
     qtd = _as_qtd(qtd)
     _ensure(qtd > 0, "Quantidade deve ser positiva")
 
-    preco_unit, promo_id, desconto_total = _preco_com_promos(sale.store_id, p, qtd)
+    # mesmo instante para a vigência da promo e o created_at do item
+    agora = datetime.utcnow()
+    preco_unit, promo_id, desconto_total = _preco_com_promos(sale.store_id, p, qtd, agora=agora)
 
+    # Decimal direto: passar por centavos em int custava mais (quantize na conversão)
     total_sem_desc = _as_money(preco_unit * qtd)
-    total = _as_money(total_sem_desc - desconto_total)
+    total = total_sem_desc - desconto_total
 
     si = SaleItem(
         sale_id=sale.id,
@@ -380,14 +701,14 @@ def adicionar_item_venda(sale_id: int, product_id: int, qtd: Decimal, user: User
         preco_unit=preco_unit,
         desconto=desconto_total,
         promo_id=promo_id,
-        total=total
+        total=total,
+        created_at=agora,
+        updated_at=agora
     )
-    db.session.add(si)
+    sale.items.append(si)  # cascade adiciona à sessão
 
     # Atualiza totais da venda
-    sale.subtotal = _as_money((sale.subtotal or 0) + total_sem_desc)
-    sale.desconto = _as_money((sale.desconto or 0) + desconto_total)
-    sale.total = _as_money((sale.total or 0) + total)
+    _somar_totais_venda(sale, total_sem_desc, desconto_total, total)
 
     audit_log(sale.store_id, "Sale", sale.id, "item_added", {"product_id": p.id, "qtd": str(qtd), "total_item": str(total)}, user)
     return si
@@ -398,22 +719,27 @@ def remover_item_venda(sale_item_id: int, user: User) -> Sale:
     sale = db.session.get(Sale, si.sale_id)
     _ensure(sale and sale.status == "aberta", "Venda não está aberta")
 
-    sale.subtotal = _as_money(sale.subtotal - (si.preco_unit * si.qtd))
-    sale.desconto = _as_money(sale.desconto - si.desconto)
-    sale.total = _as_money(sale.total - si.total)
+    _somar_totais_venda(sale, -_as_money(si.preco_unit * si.qtd), -si.desconto, -si.total)
 
-    db.session.delete(si)
+    sale.items.remove(si)  # delete-orphan apaga no flush
     audit_log(sale.store_id, "Sale", sale.id, "item_removed", {"sale_item_id": sale_item_id}, user)
     return sale
 
+def _itens_para_estoque(sale: Sale) -> List[Tuple[int, Decimal]]:
+    # (product_id, qtd) de sale.items, que o get da venda já trouxe (selectin):
+    # sem um segundo SELECT em sale_items. adicionar/remover_item_venda mexem na
+    # coleção, então ela vale mesmo antes do flush
+    return [(it.product_id, it.qtd) for it in sale.items]
+
 def pagar_venda(sale_id: int, pagamento: str, valor_pago: Decimal, customer_id: Optional[int], user: User) -> Sale:
     sale = db.session.get(Sale, sale_id)
     _ensure(sale and sale.status == "aberta", "Venda inválida ou já finalizada")
-    _ensure(len(sale.items) > 0, "Venda vazia")
+    itens = _itens_para_estoque(sale)
+    _ensure(len(itens) > 0, "Venda vazia")
     _ensure(pagamento in ("dinheiro", "cartao", "pix", "misto"), "Pagamento inválido")
 
     sale.pagamento = pagamento
-    sale.troco = _as_money(max(_as_money(valor_pago) - sale.total, Decimal("0")))
+    sale.troco = _as_money(max(_as_money(valor_pago) - sale.total, _ZERO_MONEY))
     sale.status = "concluida"
     if customer_id:
         cust = db.session.get(Customer, customer_id)
@@ -421,18 +747,10 @@ def pagar_venda(sale_id: int, pagamento: str, valor_pago: Decimal, customer_id:
         sale.customer_id = customer_id
 
     # Gera movimentos de estoque de saída por item
-    for it in sale.items:
-        sm = StockMove(
-            store_id=sale.store_id,
-            product_id=it.product_id,
-            tipo="saida_venda",
-            qtd=_as_qtd(it.qtd),
-            custo=Decimal("0.00"),
-            ref_origem="sale",
-            ref_id=sale.id,
-            created_by_id=user.id if user else None
-        )
-        db.session.add(sm)
+    criar_movimentos_em_lote(sale.store_id, (
+        dict(product_id=pid, tipo="saida_venda", qtd=qtd, ref_origem="sale", ref_id=sale.id)
+        for pid, qtd in itens
+    ), user)
 
     audit_log(sale.store_id, "Sale", sale.id, "paid", {"pagamento": pagamento, "valor_pago": str(valor_pago)}, user)
     return sale
@@ -440,24 +758,16 @@ def pagar_venda(sale_id: int, pagamento: str, valor_pago: Decimal, customer_id:
 def cancelar_venda(sale_id: int, motivo: str, user: User) -> Sale:
     sale = db.session.get(Sale, sale_id)
     _ensure(sale and sale.status in ("aberta", "concluida"), "Venda não pode ser cancelada")
+    estava_concluida = sale.status == "concluida"
     sale.status = "cancelada"
 
-    # Reverte estoque apenas se já estava concluída
-    if len(sale.items) > 0:
-        if sale.total > 0 and sale.status == "cancelada":
-            for it in sale.items:
-                sm = StockMove(
-                    store_id=sale.store_id,
-                    product_id=it.product_id,
-                    tipo="devolucao",
-                    qtd=_as_qtd(it.qtd),
-                    custo=Decimal("0.00"),
-                    ref_origem="sale",
-                    ref_id=sale.id,
-                    motivo=(motivo or "Cancelamento de venda")[:200],
-                    created_by_id=user.id if user else None
-                )
-                db.session.add(sm)
+    # Reverte estoque apenas se já estava concluída (venda aberta não baixou estoque)
+    if estava_concluida:
+        motivo_mov = (motivo or "Cancelamento de venda")[:200]
+        criar_movimentos_em_lote(sale.store_id, (
+            dict(product_id=pid, tipo="devolucao", qtd=qtd, ref_origem="sale", ref_id=sale.id, motivo=motivo_mov)
+            for pid, qtd in _itens_para_estoque(sale)
+        ), user)
 
     audit_log(sale.store_id, "Sale", sale.id, "canceled", {"motivo": motivo}, user)
     return sale
@@ -473,20 +783,23 @@ def criar_sessao_inventario(store_id: int, nome: str, setor: Optional[str], user
     audit_log(store_id, "InventorySession", None, "created", {"nome": nome, "setor": setor}, user)
     return sess
 
+_INVENTORY_COUNT_KEYS = ("qtd_contada", "qtd_atual", "conciliado")
+
 def registrar_contagem(store_id: int, session_id: int, product_id: int, qtd_contada: Decimal, user: Optional[User]) -> InventoryCount:
     sess = db.session.get(InventorySession, session_id)
     _ensure(sess and sess.store_id == store_id and sess.aberta, "Sessão inválida")
     p = db.session.get(Product, product_id)
     _ensure(p and p.store_id == store_id, "Produto inválido")
-    si = db.session.query(StockItem).filter_by(store_id=store_id, product_id=product_id).first()
-    qtd_atual = _as_qtd(si.quantidade if si else 0)
-    ic = db.session.query(InventoryCount).filter_by(session_id=session_id, product_id=product_id).first()
+    qtd_atual = _as_qtd(p.stock_qtd)
+    ic = db.session.scalars(select(InventoryCount).where(
+        InventoryCount.session_id == session_id, InventoryCount.product_id == product_id,
+    )).first()
     if ic:
-        before = _row_to_dict(ic, ["qtd_contada", "qtd_atual", "conciliado"])
+        before = _row_to_dict(ic, _INVENTORY_COUNT_KEYS)
         ic.qtd_contada = _as_qtd(qtd_contada)
         ic.qtd_atual = qtd_atual
         ic.conciliado = False
-        audit_log(store_id, "InventoryCount", ic.id, "updated", {"before": before, "after": _row_to_dict(ic, ["qtd_contada", "qtd_atual", "conciliado"])}, user)
+        audit_log(store_id, "InventoryCount", ic.id, "updated", {"before": before, "after": _row_to_dict(ic, _INVENTORY_COUNT_KEYS)}, user)
         return ic
     ic = InventoryCount(
         store_id=store_id,
@@ -502,37 +815,78 @@ def registrar_contagem(store_id: int, session_id: int, product_id: int, qtd_cont
     return ic
 
 def conciliar_inventario(store_id: int, session_id: int, user: Optional[User]) -> Tuple[int, int]:
+    """
+    Concilia a sessão inteira em SQL, sem trazer as contagens para o Python:
+    INSERT ... SELECT dos StockMove de ajuste e UPDATE ... FROM nos saldos
+    (StockItem e o espelho Product.stock_qtd). Aplica a diferença contada −
+    saldo da contagem, preservando vendas feitas entre contar e conciliar.
+    """
     sess = db.session.get(InventorySession, session_id)
     _ensure(sess and sess.store_id == store_id and sess.aberta, "Sessão inválida")
-    counts = db.session.query(InventoryCount).filter_by(session_id=session_id).all()
-    _ensure(len(counts) > 0, "Sessão sem contagens")
-
-    entradas = 0
-    saidas = 0
-    for ic in counts:
-        if ic.conciliado:
-            continue
-        dif = _as_qtd(ic.qtd_contada) - _as_qtd(ic.qtd_atual)
-        if dif == 0:
-            ic.conciliado = True
-            continue
-        tipo = "entrada_ajuste" if dif > 0 else "saida_ajuste"
-        qtd = abs(dif)
-        sm = StockMove(
-            store_id=store_id,
-            product_id=ic.product_id,
-            tipo=tipo,
-            qtd=_as_qtd(qtd),
-            custo=Decimal("0.00"),
-            ref_origem="inventory",
-            ref_id=session_id,
-            motivo="Inventário",
-            created_by_id=user.id if user else None
+
+    ic = InventoryCount.__table__
+    si = StockItem.__table__
+    prod = Product.__table__
+    dif = ic.c.qtd_contada - ic.c.qtd_atual
+    pendente = and_(ic.c.session_id == session_id, ic.c.conciliado.is_(False))
+    com_dif = and_(pendente, dif != 0)
+
+    total, entradas, saidas = db.session.execute(
+        select(
+            func.count(),
+            func.count(case((and_(ic.c.conciliado.is_(False), dif > 0), 1))),
+            func.count(case((and_(ic.c.conciliado.is_(False), dif < 0), 1))),
+        ).where(ic.c.session_id == session_id)
+    ).one()
+    _ensure(total > 0, "Sessão sem contagens")
+
+    if entradas or saidas:
+        agora = datetime.utcnow()
+        if saidas:
+            # outer join: produto sem StockItem conta como saldo zero (ganha um
+            # zerado logo abaixo), então saída de ajuste nele também é barrada
+            negativos = db.session.execute(
+                select(func.count()).select_from(ic.outerjoin(si, and_(si.c.store_id == store_id, si.c.product_id == ic.c.product_id)))
+                .where(com_dif, func.coalesce(si.c.quantidade, _ZERO_QTD) + dif < 0)
+            ).scalar()
+            _ensure(not negativos, "Operação causaria estoque negativo")
+
+        # Produto contado sem StockItem ganha um zerado antes de aplicar a diferença
+        db.session.execute(insert(si).from_select(
+            ["store_id", "product_id", "quantidade", "reservado", "created_at", "updated_at"],
+            select(
+                literal(store_id), ic.c.product_id, literal(_ZERO_QTD, QTD), literal(_ZERO_QTD, QTD),
+                literal(agora, DateTime), literal(agora, DateTime),
+            ).where(com_dif, ~exists().where(si.c.store_id == store_id, si.c.product_id == ic.c.product_id)),
+        ))
+        sm = StockMove.__table__
+        db.session.execute(insert(sm).from_select(
+            ["store_id", "product_id", "tipo", "qtd", "custo", "ref_origem", "ref_id", "motivo",
+             "created_by_id", "created_at", "updated_at"],
+            select(
+                literal(store_id), ic.c.product_id,
+                cast(case((dif > 0, "entrada_ajuste"), else_="saida_ajuste"), sm.c.tipo.type),
+                func.abs(dif), literal(_ZERO_MONEY, MONEY), literal("inventory"), literal(session_id),
+                literal("Inventário"), literal(user.id if user else None, Integer),
+                literal(agora, DateTime), literal(agora, DateTime),
+            ).where(com_dif),
+        ))
+        db.session.execute(
+            update(si)
+            .values(quantidade=si.c.quantidade + dif, updated_at=agora)
+            .where(com_dif, si.c.store_id == store_id, si.c.product_id == ic.c.product_id)
         )
-        db.session.add(sm)
-        ic.conciliado = True
-        entradas += 1 if dif > 0 else 0
-        saidas += 1 if dif < 0 else 0
+        db.session.execute(
+            update(prod)
+            .values(stock_qtd=si.c.quantidade, updated_at=agora)
+            .where(com_dif, prod.c.id == ic.c.product_id, si.c.store_id == store_id, si.c.product_id == prod.c.id)
+        )
+    db.session.execute(update(ic).values(conciliado=True).where(pendente))
+
+    # Os UPDATE acima não passam pelo ORM: instâncias já carregadas recarregam do banco
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, (StockItem, Product, InventoryCount)):
+            db.session.expire(obj)
 
     sess.aberta = False
     audit_log(store_id, "InventorySession", sess.id, "reconciled", {"entradas": entradas, "saidas": saidas}, user)
@@ -544,24 +898,28 @@ def conciliar_inventario(store_id: int, session_id: int, user: Optional[User]) -
 
 def listar_fluxo_caixa(store_id: int, data_ini: datetime, data_fim: datetime) -> Dict[str, Any]:
     """Retorna um resumo simples de fluxo de caixa por período."""
-    recs = db.session.query(Receivable).filter(
-        Receivable.store_id == store_id,
-        Receivable.vencimento >= data_ini,
-        Receivable.vencimento < data_fim
-    ).all()
-    pays = db.session.query(Payable).filter(
-        Payable.store_id == store_id,
-        Payable.vencimento >= data_ini,
-        Payable.vencimento < data_fim
-    ).all()
-    total_receber = sum((_as_money(r.valor) for r in recs if r.status == "aberto"), _as_money(0))
-    total_pagar = sum((_as_money(p.valor) for p in pays if p.status == "aberto"), _as_money(0))
+    def resumo(model):
+        # (soma dos abertos, total de títulos no período) direto do banco
+        total, count = db.session.execute(
+            select(
+                func.coalesce(func.sum(case((model.status == "aberto", model.valor))), 0),
+                func.count(model.id),
+            ).where(
+                model.store_id == store_id,
+                model.vencimento >= data_ini,
+                model.vencimento < data_fim,
+            )
+        ).one()
+        return _as_money(total), count
+
+    total_receber, count_recs = resumo(Receivable)
+    total_pagar, count_pays = resumo(Payable)
     return {
-        "a_receber": str(_as_money(total_receber)),
-        "a_pagar": str(_as_money(total_pagar)),
+        "a_receber": str(total_receber),
+        "a_pagar": str(total_pagar),
         "saldo_previsto": str(_as_money(total_receber - total_pagar)),
-        "count_recebiveis": len(recs),
-        "count_pagaveis": len(pays),
+        "count_recebiveis": count_recs,
+        "count_pagaveis": count_pays,
     }
 
 # =============================================================================
@@ -569,56 +927,56 @@ def listar_fluxo_caixa(store_id: int, data_ini: datetime, data_fim: datetime) ->
 # =============================================================================
 
 def relatorio_vendas_por_dia(store_id: int, data_ini: datetime, data_fim: datetime) -> List[Dict[str, Any]]:
-    q = (
-        db.session.query(
-            Sale.created_at.label("dia"),
-            db.func.sum(Sale.total).label("total"),
-            db.func.count(Sale.id).label("qtd")
-        )
-        .filter(
+    # Core select + tuplas; agrupa e devolve o mesmo date(created_at) (no sqlite
+    # date() volta texto; o type_coerce faz o Date do SQLAlchemy converter)
+    dia = type_coerce(func.date(Sale.created_at), Date)
+    stmt = (
+        select(dia, func.sum(Sale.total), func.count(Sale.id))
+        .where(
             Sale.store_id == store_id,
             Sale.status == "concluida",
             Sale.created_at >= data_ini,
             Sale.created_at < data_fim
         )
-        .group_by(db.func.date(Sale.created_at))
-        .order_by(db.func.date(Sale.created_at))
+        .group_by(dia)
+        .order_by(dia)
+        .execution_options(yield_per=500)
     )
-    out = []
-    for row in q:
-        out.append({"dia": row.dia.date().isoformat(), "total": str(_as_money(row.total or 0)), "qtd": int(row.qtd or 0)})
-    return out
+    as_money = _as_money
+    return [
+        {"dia": d.isoformat(), "total": str(as_money(total or 0)), "qtd": int(qtd or 0)}
+        for d, total, qtd in db.session.execute(stmt)
+    ]
 
 def relatorio_giro_estoque(store_id: int, limit: int = 50) -> List[Dict[str, Any]]:
     """
     Top produtos por vendas (qtd) em toda a base. Ajuste filtros no controlador conforme necessário.
     """
-    q = (
-        db.session.query(
-            Product.id, Product.nome,
-            db.func.sum(SaleItem.qtd).label("qtd"),
-            db.func.sum(SaleItem.total).label("faturamento")
-        )
+    qtd = func.sum(SaleItem.qtd).label("qtd")
+    stmt = (
+        select(Product.id, Product.nome, qtd, func.sum(SaleItem.total))
         .join(SaleItem, SaleItem.product_id == Product.id)
         .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
+        .where(
             Product.store_id == store_id,
             Product.deleted.is_(False),
             Sale.status == "concluida"
         )
         .group_by(Product.id, Product.nome)
-        .order_by(db.desc("qtd"))
+        .order_by(qtd.desc())
         .limit(limit)
+        .execution_options(yield_per=500)
     )
-    out = []
-    for row in q:
-        out.append({
-            "product_id": row.id,
-            "nome": row.nome,
-            "qtd": str(_as_qtd(row.qtd or 0)),
-            "faturamento": str(_as_money(row.faturamento or 0))
-        })
-    return out
+    as_money, as_qtd = _as_money, _as_qtd
+    return [
+        {
+            "product_id": pid,
+            "nome": nome,
+            "qtd": str(as_qtd(q or 0)),
+            "faturamento": str(as_money(fat or 0))
+        }
+        for pid, nome, q, fat in db.session.execute(stmt)
+    ]
 
 # =============================================================================
 # Operações de inicialização
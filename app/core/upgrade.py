@@ -0,0 +1,162 @@
+# app/core/upgrade.py
+from __future__ import annotations
+
+from typing import Callable, List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app.extensions import db
+
+# `flask upgrade-db`: traz um banco criado por versão anterior para o schema
+# atual. Não há revisões do Alembic no projeto e o create_all só cria tabelas
+# inteiras; os passos abaixo cobrem o que mudou em tabelas que já existem.
+# Todos são idempotentes (conferem o schema antes de alterar).
+
+
+def _colunas(insp, tabela: str) -> set:
+    return {c["name"] for c in insp.get_columns(tabela)}
+
+
+def _add_check_pg(conn, insp, tabela: str, nome: str, expr: str, log) -> None:
+    # SQLite não aceita ADD CONSTRAINT: lá a regra fica com os validators/formulários
+    if conn.dialect.name != "postgresql":
+        return
+    if nome in {c["name"] for c in insp.get_check_constraints(tabela)}:
+        return
+    conn.execute(text(f"ALTER TABLE {tabela} ADD CONSTRAINT {nome} CHECK ({expr})"))
+    log(f"{tabela}: constraint {nome} criada")
+
+
+def _espelho_estoque(conn, insp, log) -> None:
+    """products.stock_qtd/stock_reservado (espelho de stock_items) + backfill."""
+    cols = _colunas(insp, "products")
+    novas = [c for c in ("stock_qtd", "stock_reservado") if c not in cols]
+    for col in novas:
+        conn.execute(text(f"ALTER TABLE products ADD COLUMN {col} NUMERIC(14, 4) DEFAULT 0 NOT NULL"))
+        log(f"products: coluna {col} criada")
+    if novas:
+        n = conn.execute(text(
+            "UPDATE products SET"
+            " stock_qtd = COALESCE((SELECT si.quantidade FROM stock_items si"
+            "  WHERE si.product_id = products.id AND si.store_id = products.store_id), 0),"
+            " stock_reservado = COALESCE((SELECT si.reservado FROM stock_items si"
+            "  WHERE si.product_id = products.id AND si.store_id = products.store_id), 0)"
+        )).rowcount
+        log(f"products: espelho de estoque preenchido ({n} produtos)")
+    _add_check_pg(conn, insp, "products", "ck_products_stock_qtd_nao_negativa", "stock_qtd >= 0", log)
+
+
+def _sku_sem_duplicata(conn, insp, log) -> None:
+    """ux_products_store_sku_lower exige SKU único por loja sem diferenciar caixa."""
+    dups = conn.execute(text(
+        "SELECT store_id, lower(sku) AS sku, COUNT(*) AS n FROM products"
+        " WHERE sku IS NOT NULL GROUP BY store_id, lower(sku) HAVING COUNT(*) > 1"
+        " ORDER BY store_id, lower(sku)"
+    )).all()
+    if dups:
+        lista = ", ".join(f"loja {r.store_id}: {r.sku!r} ({r.n}x)" for r in dups[:20])
+        raise ValueError(
+            "SKUs repetidos (ignorando maiúsculas) impedem o índice único "
+            f"ux_products_store_sku_lower. Corrija antes de atualizar: {lista}"
+        )
+
+
+def _indices(conn, insp, log) -> None:
+    """Índices declarados nos models que faltam em tabelas já existentes."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for tabela in db.metadata.sorted_tables:
+        if not insp.has_table(tabela.name):
+            continue  # tabela nova: o create_all cria junto com os índices
+        for ix in sorted(tabela.indexes, key=lambda i: i.name):
+            ddl = CreateIndex(ix, if_not_exists=True)
+            # respeita o ddl_if (ex.: GIN de trigramas só no PostgreSQL)
+            if ix._ddl_if is not None and not ix._ddl_if._should_execute(ddl, ix, conn):
+                continue
+            # IF NOT EXISTS em vez do inspector: o SQLite não reflete índice de expressão
+            conn.execute(ddl)
+    log("índices conferidos")
+
+
+def _include_lista(conn, insp, log) -> None:
+    """Índices da lista de produtos criados com stock_qtd/preco_venda no INCLUDE."""
+    if conn.dialect.name != "postgresql":
+        return  # fora do PostgreSQL não há INCLUDE
+    for nome in ("ix_products_store_active_created", "ix_products_store_created"):
+        ddl = conn.execute(
+            text("SELECT indexdef FROM pg_indexes WHERE indexname = :n"), {"n": nome}
+        ).scalar()
+        if ddl and ("stock_qtd" in ddl or "preco_venda" in ddl):
+            # _indices recria com o INCLUDE atual logo em seguida
+            conn.execute(text(f"DROP INDEX {nome}"))
+            log(f"products: índice {nome} removido (INCLUDE antigo)")
+
+
+def _ids_bigint_cache(conn, insp, log) -> None:
+    """stock_moves/audit_logs.id: BIGINT com sequência CACHE 100 (PostgreSQL)."""
+    if conn.dialect.name != "postgresql":
+        return  # no SQLite o id é o rowid, sem sequência
+    for tabela in ("stock_moves", "audit_logs"):
+        if not insp.has_table(tabela):
+            continue
+        tipo, identity = conn.execute(text(
+            "SELECT data_type, is_identity FROM information_schema.columns"
+            " WHERE table_schema = current_schema() AND table_name = :t AND column_name = 'id'"
+        ), {"t": tabela}).one()
+        seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": tabela}).scalar()
+        if tipo != "bigint":
+            conn.execute(text(f"ALTER TABLE {tabela} ALTER COLUMN id TYPE bigint"))
+            if seq and identity != "YES":
+                conn.execute(text(f"ALTER SEQUENCE {seq} AS bigint"))  # serial nasce AS integer
+            log(f"{tabela}: id convertido para bigint")
+        cache = conn.execute(text(
+            "SELECT seqcache FROM pg_sequence WHERE seqrelid = CAST(:s AS regclass)"
+        ), {"s": seq}).scalar() if seq else None
+        if seq and cache != 100:
+            # sequência de IDENTITY só aceita opções pelo ALTER TABLE
+            if identity == "YES":
+                conn.execute(text(f"ALTER TABLE {tabela} ALTER COLUMN id SET CACHE 100"))
+            else:
+                conn.execute(text(f"ALTER SEQUENCE {seq} CACHE 100"))
+            log(f"{tabela}: sequência do id com CACHE 100")
+
+
+# Índices que saíram dos models (substituídos por outros): só custam escrita
+_INDICES_REMOVIDOS = (
+    "ix_products_nome_lower",  # virou ix_products_store_nome_lower
+    "ix_stock_moves_tipo",  # nada filtra só por tipo
+)
+
+
+def _indices_obsoletos(conn, insp, log) -> None:
+    """Remove os índices de _INDICES_REMOVIDOS que ainda existam."""
+    for nome in _INDICES_REMOVIDOS:
+        # IF EXISTS em vez do inspector: o SQLite não reflete índice de expressão
+        conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+    log("índices obsoletos conferidos")
+
+
+def _checks_produto(conn, insp, log) -> None:
+    """Faixas de estoque_minimo/ponto_pedido no banco (PostgreSQL)."""
+    _add_check_pg(conn, insp, "products", "ck_products_estoque_minimo", "estoque_minimo >= 0", log)
+    _add_check_pg(conn, insp, "products", "ck_products_ponto_pedido", "ponto_pedido >= 0", log)
+
+
+_PASSOS: List[Callable] = [
+    _espelho_estoque,
+    _checks_produto,
+    _sku_sem_duplicata,
+    _include_lista,
+    _ids_bigint_cache,
+    _indices_obsoletos,
+    _indices,
+]
+
+
+def upgrade(log: Callable[[str], None] = print) -> None:
+    """Aplica os passos numa transação só (tudo ou nada)."""
+    with db.engine.begin() as conn:
+        for passo in _PASSOS:
+            # inspector novo a cada passo: o anterior pode ter mudado o schema
+            passo(conn, inspect(conn), log)
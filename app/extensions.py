@@ -1,20 +1,105 @@
 # app/extensions.py
 from __future__ import annotations
 
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
 from flask_migrate import Migrate
 from flask_login import LoginManager, AnonymousUserMixin
 from flask_wtf import CSRFProtect
 from flask_mail import Mail
 from flask_cors import CORS
 
+# Colunas JSON (AuditLog.payload_json a cada operação, Promo.regra_json): usa orjson
+# se estiver instalado; senão json da stdlib em formato compacto. Decimal (valores
+# de _row_to_dict no audit) vai como string, sem perder casas.
+try:
+    import orjson
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    json_loads = orjson.loads
+except ImportError:
+    json_dumps = partial(json.dumps, separators=(",", ":"), ensure_ascii=False, default=str)
+    json_loads = json.loads
+
+# PRAGMAs do SQLite, uma vez por conexão nova (registrado no import, não a cada
+# create_app). WAL + synchronous=NORMAL: escritas do PDV sem fsync por commit e
+# leitura de relatório sem travar o caixa; cache de 64 MB, temporários em memória
+# e leitura via mmap (até 256 MB do arquivo) para os relatórios que varrem
+# vendas/estoque.
+_SQLITE_PRAGMAS = """
+PRAGMA foreign_keys=ON;
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-64000;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+"""
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.executescript(_SQLITE_PRAGMAS)
+
 db = SQLAlchemy()
+
+# Invalidação de cache em processo (choices, banner do login) só no fim da
+# transação: antes do COMMIT outro request ainda lê o dado antigo e recoloca
+# no cache até o TTL. No rollback também descarta, porque este request pode ter
+# montado o cache com o que não vingou.
+def invalidate_after_commit(session, fn, *args) -> None:
+    session.info.setdefault("invalidar", set()).add((fn, args))
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _run_invalidations(session):
+    for fn, args in session.info.pop("invalidar", ()):
+        fn(*args)
+
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
 mail = Mail()
+# Tarefas longas disparadas por request (ex.: import de CSV grande). Sem Celery/Redis
+# (ENABLE_CELERY=false no structure.yaml): roda em threads do próprio processo
+job_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jobs")
 
 def init_extensions(app):
+    # Opções vindas da config têm precedência sobre os padrões abaixo
+    engine_opts = {
+        "json_serializer": json_dumps,
+        "json_deserializer": json_loads,
+        # Cache de SQL compilado (padrão 500): services + views + relatórios passam disso
+        "query_cache_size": app.config.get("DB_QUERY_CACHE_SIZE", 1200),
+    }
+    if not app.config.get("SQLALCHEMY_DATABASE_URI", "").startswith("sqlite"):
+        # Banco servidor (PostgreSQL): pool acima do padrão 5+10 para PDV + dashboard
+        # sem abrir conexão (TCP + auth) por request; pre_ping descarta conexão morta
+        # (failover, idle timeout) antes de entregar e recycle renova a cada 30 min.
+        # LIFO reusa as conexões mais quentes e deixa as ociosas expirarem no servidor.
+        # No SQLite o Flask-SQLAlchemy já escolhe o pool (StaticPool em memória).
+        engine_opts.update(
+            pool_size=app.config.get("DB_POOL_SIZE", 20),
+            max_overflow=app.config.get("DB_MAX_OVERFLOW", 40),
+            pool_pre_ping=True, pool_recycle=1800, pool_use_lifo=True,
+        )
+        if make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_driver_name() == "psycopg2":
+            # INSERT em lote já sai multi-linha (insertmanyvalues); "values_plus_batch"
+            # agrupa também os UPDATE/DELETE executemany do flush (ex.: produtos
+            # atualizados num import) com execute_batch, em vez de um por linha
+            engine_opts["executemany_mode"] = "values_plus_batch"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_opts,
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
@@ -26,20 +111,8 @@ def init_extensions(app):
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "warning"
 
-    # Ativa FKs no SQLite
-    with app.app_context():
-        if app.config.get("SQLALCHEMY_DATABASE_URI", "").startswith("sqlite"):
-            from sqlalchemy import event
-            from sqlalchemy.engine import Engine
-
-            @event.listens_for(Engine, "connect")
-            def set_sqlite_pragma(dbapi_connection, connection_record):
-                cursor = dbapi_connection.cursor()
-                cursor.execute("PRAGMA foreign_keys=ON")
-                cursor.close()
-
     # Import tardio para evitar import circular
-    from app.core.models import User  # noqa
+    from app.core.models import User, load_login_user  # noqa
 
     # Se o modelo não usa UserMixin, garante a interface esperada
     if not hasattr(User, "get_id"):
@@ -59,6 +132,6 @@ def init_extensions(app):
     @login_manager.user_loader
     def load_user(user_id: str):
         try:
-            return User.query.get(int(user_id))
+            return load_login_user(int(user_id))
         except Exception:
             return None
@@ -4,8 +4,10 @@ from __future__ import annotations
 from decimal import Decimal
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload
 
 from app.core.models import Product, Sale, SaleItem
+from app.core.choices import product_choices
 from app.core.forms import SaleOpenForm, SaleAddItemForm, SalePaymentForm, SaleCancelForm, SearchForm
 from app.core.services import transaction, abrir_venda, adicionar_item_venda, pagar_venda, cancelar_venda
 
@@ -15,14 +17,24 @@ bp = Blueprint("pos", __name__, template_folder="../templates")
 @login_required
 def pos_home():
     sale_id = request.args.get("sale_id", type=int)
-    sale = Sale.query.filter_by(id=sale_id, store_id=current_user.store_id).first() if sale_id else None
+    sale = (
+        Sale.query.filter_by(id=sale_id, store_id=current_user.store_id)
+        .options(
+            # só o que a tabela do PDV mostra
+            selectinload(Sale.items)
+            .load_only(SaleItem.product_id, SaleItem.qtd, SaleItem.preco_unit, SaleItem.desconto, SaleItem.total)
+            .joinedload(SaleItem.product).load_only(Product.nome)
+        )
+        .first()
+        if sale_id else None
+    )
     form_open = SaleOpenForm()
     form_add = SaleAddItemForm()
     form_pay = SalePaymentForm()
     form_cancel = SaleCancelForm()
     form_search = SearchForm()
     # Preencher selects
-    form_add.product_id.choices = _product_choices()
+    form_add.product_id.choices = product_choices(current_user.store_id)
     form_pay.customer_id.choices = [("", "Sem cliente")]
     return render_template("pos.html", sale=sale, form_open=form_open, form_add=form_add, form_pay=form_pay, form_cancel=form_cancel, form_search=form_search)
 
@@ -37,7 +49,7 @@ def sale_open():
 @login_required
 def sale_add(sale_id: int):
     form = SaleAddItemForm()
-    form.product_id.choices = _product_choices()
+    form.product_id.choices = product_choices(current_user.store_id)
     if not form.validate_on_submit():
         flash("Informe produto e quantidade válida", "danger")
         return redirect(url_for("pos.pos_home", sale_id=sale_id))
@@ -67,7 +79,3 @@ def sale_cancel(sale_id: int):
         cancelar_venda(sale_id, form.motivo.data or "Cancelamento", current_user)
     flash("Venda cancelada", "info")
     return redirect(url_for("pos.pos_home"))
-
-def _product_choices():
-    prods = Product.query.filter_by(store_id=current_user.store_id, deleted=False, ativo=True).order_by(Product.nome).limit(500).all()
-    return [(p.id, f"{p.nome} [{p.ean or 'sem EAN'}]") for p in prods]
@@ -1,26 +1,41 @@
 # app/views/products.py
 from __future__ import annotations
 
+from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import csv
-from io import StringIO, BytesIO
+import os
+from operator import itemgetter
+import shutil
+from io import StringIO, TextIOWrapper
 
 from flask import (
     Blueprint, render_template, redirect, url_for,
-    request, flash, send_file, abort
+    request, flash, abort, current_app, jsonify, Response, stream_with_context
 )
 from flask_login import login_required, current_user
-from sqlalchemy import or_
+from sqlalchemy import bindparam, case, func, insert, lambda_stmt, literal, or_, select, update
+from sqlalchemy.orm import load_only
 
-from app.extensions import db
+from app.extensions import db, job_pool
 from app.core.models import (
-    Product, Category, StockItem, PriceVersion
+    Product, Category, StockItem, PriceVersion, normalize_ean, parse_decimal,
+    MONEY, QTD, _ZERO_MONEY, _ZERO_QTD
 )
 from app.core.forms import ProductForm
+from app.core.choices import category_choices, invalidate_choices
+from app.core.jobs import create_job, get_job, job_file, remove_job, update_job
+from app.core.services import criar_produtos_em_lote, upsert_disponivel, upsert_produtos_por_ean
 
 bp = Blueprint("products", __name__, url_prefix="/products", template_folder="../templates")
 
+# Busca do produto por id na loja (edit). lambda_stmt guarda a árvore da
+# expressão no cache: cada chamada só liga os parâmetros.
+_GET_PRODUCT = lambda_stmt(
+    lambda: select(Product).where(Product.id == bindparam("pid"), Product.store_id == bindparam("store_id"))
+)
+
 
 # --------------------------------
 # Helpers
@@ -35,16 +50,19 @@ def _role_can_edit() -> bool:
     return getattr(current_user, "role", "") in ("admin", "gerente")
 
 def _set_category_choices(form: ProductForm, store_id: int) -> None:
-    cats = Category.query.filter_by(store_id=store_id, ativo=True).order_by(Category.nome).all()
-    form.categoria_id.choices = [("", "Selecione...")] + [(str(c.id), c.nome) for c in cats]
+    form.categoria_id.choices = category_choices(store_id)
 
-def _dec(v: Optional[str], places=2) -> Decimal:
-    if v in (None, ""):
-        return Decimal("0.00") if places == 2 else Decimal("0.0000")
+def _intval(s: Optional[str]) -> Optional[int]:
     try:
-        return Decimal(str(v).replace(",", "."))
+        return int(s) if s not in (None, "",) else None
     except Exception:
-        return Decimal("0.00") if places == 2 else Decimal("0.0000")
+        return None
+
+def _dec(v: Optional[str], places=2) -> Decimal:
+    d = parse_decimal(v)
+    if d is None:
+        return _ZERO_MONEY if places == 2 else _ZERO_QTD
+    return d
 
 
 # --------------------------------
@@ -61,17 +79,36 @@ def list_():
     if not show_inactive:
         query = query.filter(Product.ativo.is_(True))
 
-    if q:
+    if len(q) >= 3:
+        # ILIKE sem lower() na coluna: é o que os índices GIN de trigramas atendem
         like = f"%{q}%"
+        query = query.filter(
+            or_(
+                Product.nome.ilike(like),
+                Product.sku.ilike(like),
+                Product.ean.ilike(like),
+            )
+        )
+    elif q:
+        # Menos de 3 caracteres não forma trigrama: prefixo, com q já minúsculo
+        # comparado a lower(col) (ix_products_store_nome_lower atende o nome)
+        like = f"{q}%"
         query = query.filter(
             or_(
                 db.func.lower(Product.nome).like(like),
                 db.func.lower(Product.sku).like(like),
-                db.func.lower(Product.ean).like(like),
+                Product.ean.like(like),
             )
         )
 
-    items = query.order_by(Product.created_at.desc()).limit(300).all()
+    # Só as colunas da tabela (o estoque vem do espelho stock_qtd, sem JOIN);
+    # categoria não aparece na lista, então não é carregada
+    items = (
+        query.options(load_only(Product.nome, Product.ean, Product.preco_venda, Product.stock_qtd))
+        .order_by(Product.created_at.desc())
+        .limit(300)
+        .all()
+    )
     return render_template("products_list.html", items=items, q=q, show_inactive=show_inactive)
 
 
@@ -116,24 +153,22 @@ def new_post():
             unidade=form.unidade.data if isinstance(form.unidade.data, str) else "UN",
             ncm=(form.ncm.data or None),
             cest=(form.cest.data or None),
-            custo_atual=form.custo_atual.data or Decimal("0.00"),
-            preco_venda=form.preco_venda.data or Decimal("0.00"),
-            margem_alvo=form.margem_alvo.data or Decimal("0.00"),
-            estoque_minimo=form.estoque_minimo.data or Decimal("0.0000"),
-            ponto_pedido=form.ponto_pedido.data or Decimal("0.0000"),
+            custo_atual=form.custo_atual.data or _ZERO_MONEY,
+            preco_venda=form.preco_venda.data or _ZERO_MONEY,
+            margem_alvo=form.margem_alvo.data or _ZERO_MONEY,
+            estoque_minimo=form.estoque_minimo.data or _ZERO_QTD,
+            ponto_pedido=form.ponto_pedido.data or _ZERO_QTD,
             foto_url=(form.foto_url.data or None),
             ativo=bool(form.ativo.data),
         )
+        # Produto novo não tem StockItem: sem SELECT de checagem nem flush para
+        # pegar p.id, as linhas vão pelas relações no mesmo flush do commit
+        p.stock_item = StockItem(store_id=store_id, quantidade=_ZERO_QTD)
         db.session.add(p)
-        db.session.flush()  # pega p.id
-
-        # Garante estoque
-        if not StockItem.query.filter_by(store_id=store_id, product_id=p.id).first():
-            db.session.add(StockItem(store_id=store_id, product_id=p.id, quantidade=Decimal("0.0000")))
 
         # Histórico de preço
         if p.preco_venda and p.preco_venda > 0:
-            db.session.add(PriceVersion(store_id=store_id, product_id=p.id, preco=p.preco_venda, origem="manual"))
+            db.session.add(PriceVersion(store_id=store_id, product=p, preco=p.preco_venda, origem="manual"))
 
         db.session.commit()
         flash("Produto cadastrado", "success")
@@ -155,7 +190,9 @@ def new_post():
 @login_required
 def edit(pid: int):
     store_id = _require_store()
-    p = Product.query.filter_by(id=pid, store_id=store_id).first_or_404()
+    p = db.session.execute(_GET_PRODUCT, {"pid": pid, "store_id": store_id}).scalar_one_or_none()
+    if p is None:
+        abort(404)
 
     if request.method == "GET":
         form = ProductForm(obj=p)
@@ -174,7 +211,7 @@ def edit(pid: int):
         return render_template("product_form.html", form=form, product=p)
 
     try:
-        preco_antigo = p.preco_venda or Decimal("0.00")
+        preco_antigo = p.preco_venda or _ZERO_MONEY
 
         p.nome = form.nome.data.strip()
         p.sku = form.sku.data or None
@@ -183,11 +220,11 @@ def edit(pid: int):
         p.unidade = form.unidade.data if isinstance(form.unidade.data, str) else "UN"
         p.ncm = form.ncm.data or None
         p.cest = form.cest.data or None
-        p.custo_atual = form.custo_atual.data or Decimal("0.00")
-        p.preco_venda = form.preco_venda.data or Decimal("0.00")
-        p.margem_alvo = form.margem_alvo.data or Decimal("0.00")
-        p.estoque_minimo = form.estoque_minimo.data or Decimal("0.0000")
-        p.ponto_pedido = form.ponto_pedido.data or Decimal("0.0000")
+        p.custo_atual = form.custo_atual.data or _ZERO_MONEY
+        p.preco_venda = form.preco_venda.data or _ZERO_MONEY
+        p.margem_alvo = form.margem_alvo.data or _ZERO_MONEY
+        p.estoque_minimo = form.estoque_minimo.data or _ZERO_QTD
+        p.ponto_pedido = form.ponto_pedido.data or _ZERO_QTD
         p.foto_url = form.foto_url.data or None
         p.ativo = bool(form.ativo.data)
 
@@ -218,8 +255,14 @@ def toggle(pid: int):
         return redirect(url_for("products.list_"))
 
     store_id = _require_store()
-    p = Product.query.filter_by(id=pid, store_id=store_id).first_or_404()
-    p.ativo = not p.ativo
+    # NOT ativo no próprio UPDATE: dois cliques simultâneos não leem o mesmo valor
+    res = db.session.execute(
+        update(Product).where(Product.id == pid, Product.store_id == store_id).values(ativo=~Product.ativo)
+    )
+    if not res.rowcount:
+        abort(404)
+    # UPDATE fora do ORM não dispara os eventos; o cache sai no commit abaixo
+    invalidate_choices("product", store_id)
     db.session.commit()
     flash("Status atualizado", "info")
     return redirect(url_for("products.list_"))
@@ -236,9 +279,12 @@ def delete(pid: int):
         return redirect(url_for("products.list_"))
 
     store_id = _require_store()
-    p = Product.query.filter_by(id=pid, store_id=store_id).first_or_404()
-    p.deleted = True
-    p.ativo = False
+    res = db.session.execute(
+        update(Product).where(Product.id == pid, Product.store_id == store_id).values(deleted=True, ativo=False)
+    )
+    if not res.rowcount:
+        abort(404)
+    invalidate_choices("product", store_id)  # aplicado no commit
     db.session.commit()
     flash("Produto removido", "info")
     return redirect(url_for("products.list_"))
@@ -247,123 +293,343 @@ def delete(pid: int):
 # --------------------------------
 # Exportar CSV
 # --------------------------------
+_EXPORT_BATCH = 500  # linhas por ida ao cursor / por pedaço enviado
+
+
+_EXPORT_HEADER = (
+    "id","produto","sku","ean","categoria_id","unidade","ncm","cest",
+    "preco_compra","preco_venda","lucro_desejado","estoque_minimo","ponto_pedido","ativo"
+)
+
+
+def _export_chunks(store_id: int):
+    """Gera o CSV em pedaços de _EXPORT_BATCH linhas (BOM + cabeçalho no 1º)."""
+    # Defaults no próprio SELECT (None já sai vazio no csv): as tuplas vão direto
+    # para writerows, sem laço Python por campo
+    zero_money = literal(_ZERO_MONEY, MONEY)
+    zero_qtd = literal(_ZERO_QTD, QTD)
+    stmt = (
+        select(
+            Product.id, Product.nome, Product.sku, Product.ean, Product.categoria_id,
+            Product.unidade, Product.ncm, Product.cest,
+            func.coalesce(Product.custo_atual, zero_money),
+            func.coalesce(Product.preco_venda, zero_money),
+            func.coalesce(Product.margem_alvo, zero_money),
+            func.coalesce(Product.estoque_minimo, zero_qtd),
+            func.coalesce(Product.ponto_pedido, zero_qtd),
+            case((Product.ativo.is_(True), 1), else_=0),
+        )
+        .where(Product.store_id == store_id)
+        .order_by(Product.id.asc())
+        .execution_options(yield_per=_EXPORT_BATCH)
+    )
+    # Um lote de linhas em memória por vez, não o catálogo inteiro
+    buf = StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    buf.write("\ufeff")  # BOM, como o utf-8-sig de antes (Excel)
+    w.writerow(_EXPORT_HEADER)
+    for part in db.session.execute(stmt).partitions():
+        w.writerows(part)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()  # catálogo vazio: só BOM + cabeçalho
+
+
+def _run_export_job(app, job_id: str, store_id: int) -> None:
+    with app.app_context():
+        # O CSV fica ao lado do JSON do job (app.core.jobs): qualquer worker
+        # serve o download e o prune apaga o arquivo que ninguém baixou
+        path = job_file(job_id, "csv")
+        try:
+            with open(path, "w", encoding="utf-8", newline="") as out:
+                out.writelines(_export_chunks(store_id))
+            update_job(job_id, status="concluido")
+        except Exception as e:
+            db.session.rollback()
+            if os.path.exists(path):
+                os.remove(path)
+            update_job(job_id, status="erro", erro=str(e))
+
+
 @bp.get("/export.csv")
 @login_required
 def export_csv():
     store_id = _require_store()
-    qs = Product.query.filter_by(store_id=store_id).order_by(Product.id.asc()).all()
 
-    buf = StringIO()
-    w = csv.writer(buf, lineterminator="\n")
-    w.writerow([
-        "id","produto","sku","ean","categoria_id","unidade","ncm","cest",
-        "preco_compra","preco_venda","lucro_desejado","estoque_minimo","ponto_pedido","ativo"
-    ])
-    for p in qs:
-        w.writerow([
-            p.id, p.nome or "", p.sku or "", p.ean or "", p.categoria_id or "",
-            p.unidade or "", p.ncm or "", p.cest or "",
-            str(p.custo_atual or Decimal("0.00")),
-            str(p.preco_venda or Decimal("0.00")),
-            str(p.margem_alvo or Decimal("0.00")),
-            str(p.estoque_minimo or Decimal("0.0000")),
-            str(p.ponto_pedido or Decimal("0.0000")),
-            1 if p.ativo else 0
-        ])
-
-    data = buf.getvalue().encode("utf-8-sig")
-    bio = BytesIO(data)
-    bio.seek(0)
-    return send_file(
-        bio,
+    # Catálogo grande vai para o job_pool: o worker do request (e a conexão)
+    # não ficam presos durante o dump; o arquivo sai por /export/<job_id>/download
+    limite = current_app.config.get("EXPORT_BACKGROUND_ROWS", 50000)
+    total = db.session.execute(select(func.count(Product.id)).where(Product.store_id == store_id)).scalar()
+    if total > limite:
+        job_id = create_job("export", store_id=store_id, status="executando", linhas=total)
+        job_pool.submit(_run_export_job, current_app._get_current_object(), job_id, store_id)
+        flash(
+            f"Exportação em andamento (job {job_id}). Status em "
+            f"{url_for('products.export_status', job_id=job_id)} por até "
+            f"{current_app.config.get('JOBS_TTL_SECONDS', 3600) // 60} min.",
+            "info",
+        )
+        return redirect(url_for("products.list_"))
+
+    return Response(
+        stream_with_context(_export_chunks(store_id)),
         mimetype="text/csv; charset=utf-8",
-        as_attachment=True,
-        download_name="produtos.csv"
+        headers={"Content-Disposition": "attachment; filename=produtos.csv"},
+    )
+
+
+def _export_job_or_404(job_id: str) -> Dict[str, object]:
+    job = get_job(job_id, "export")
+    if job is None or job["store_id"] != _require_store():
+        abort(404)
+    return job
+
+
+@bp.get("/export/<job_id>")
+@login_required
+def export_status(job_id: str):
+    job = _export_job_or_404(job_id)
+    out = {k: v for k, v in job.items() if k not in ("kind", "store_id")}
+    if job["status"] == "concluido":
+        out["download"] = url_for("products.export_download", job_id=job_id)
+    return jsonify(out)
+
+
+@bp.get("/export/<job_id>/download")
+@login_required
+def export_download(job_id: str):
+    job = _export_job_or_404(job_id)
+    if job["status"] != "concluido":
+        abort(404)
+    # Download único: abre o CSV e já apaga o job (JSON + arquivo); o envio segue
+    # pelo descritor aberto e nada sobra no disco se a conexão cair no meio
+    try:
+        fh = open(job_file(job_id, "csv"), "rb")
+    except FileNotFoundError:
+        abort(404)  # outro request baixou primeiro
+    remove_job(job_id)
+
+    def enviar():
+        with fh:
+            yield from iter(lambda: fh.read(1 << 16), b"")
+
+    return Response(
+        enviar(),
+        mimetype="text/csv; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=produtos.csv"},
     )
 
 
 # --------------------------------
 # Importar CSV simples
 # --------------------------------
-@bp.post("/import")
-@login_required
-def import_csv():
-    if not _role_can_edit():
-        flash("Acesso negado", "danger")
-        return redirect(url_for("products.list_"))
+def _csv_col(fieldnames, *names):
+    """Getter da coluna, resolvido uma vez pelo cabeçalho (aliases: a 1ª preenchida vence)."""
+    present = [n for n in names if n in fieldnames]
+    if not present:
+        return lambda row: None
+    if len(present) == 1:
+        return itemgetter(present[0])
+    return lambda row: next((row[n] for n in present if row[n]), None)
+
+
+def _csv_row_parser(fieldnames):
+    """
+    Monta, uma vez por arquivo, o conversor linha -> campos do Product.
+    Colunas ausentes viram constantes e os aliases do export já ficam escolhidos,
+    então o loop não repete `row.get(a) or row.get(b)` para cada campo.
+    """
+    fieldnames = set(fieldnames)
+    nome_ = _csv_col(fieldnames, "produto", "nome")
+    ean_ = _csv_col(fieldnames, "ean")
+    sku_ = _csv_col(fieldnames, "sku")
+    cat_ = _csv_col(fieldnames, "categoria_id")
+    unidade_ = _csv_col(fieldnames, "unidade")
+    ncm_ = _csv_col(fieldnames, "ncm")
+    cest_ = _csv_col(fieldnames, "cest")
+    custo_ = _csv_col(fieldnames, "preco_compra", "custo_atual")
+    preco_ = _csv_col(fieldnames, "preco_venda")
+    margem_ = _csv_col(fieldnames, "lucro_desejado", "margem_alvo")
+    minimo_ = _csv_col(fieldnames, "estoque_minimo")
+    ponto_ = _csv_col(fieldnames, "ponto_pedido")
+    ativo_ = _csv_col(fieldnames, "ativo")
+
+    def parse(row) -> Optional[Dict[str, object]]:
+        nome = (nome_(row) or "").strip()
+        if not nome:
+            return None
+        return dict(
+            nome=nome,
+            # Mesmo formato que o validator grava (só dígitos)
+            ean=normalize_ean((ean_(row) or "").strip()),
+            sku=(sku_(row) or "").strip() or None,
+            categoria_id=_intval(cat_(row)),
+            unidade=(unidade_(row) or "UN"),
+            ncm=(ncm_(row) or None),
+            cest=(cest_(row) or None),
+            custo_atual=_dec(custo_(row), 2),
+            preco_venda=_dec(preco_(row), 2),
+            margem_alvo=_dec(margem_(row), 2),
+            estoque_minimo=_dec(minimo_(row), 4),
+            ponto_pedido=_dec(ponto_(row), 4),
+            ativo=(str(ativo_(row) or "1").strip().lower() in ("1", "true", "sim")),
+        )
+    return parse
 
-    store_id = _require_store()
-    f = request.files.get("file")
-    if not f:
-        flash("Envie um arquivo CSV", "warning")
-        return redirect(url_for("products.list_"))
 
-    decoded = f.read().decode("utf-8-sig", errors="ignore")
-    reader = csv.DictReader(StringIO(decoded))
-    count_new = 0
+_IN_CHUNK = 1000  # abaixo do limite de parâmetros por statement do sqlite/PG
+
+
+def _in_chunks(col, values) -> list:
+    """`col IN (...)` em fatias de _IN_CHUNK valores; lista vazia se não há valores."""
+    values = sorted(values)
+    return [col.in_(values[i:i + _IN_CHUNK]) for i in range(0, len(values), _IN_CHUNK)]
+
+
+def _import_products(store_id: int, reader) -> Tuple[int, int]:
+    """Cria/atualiza produtos a partir das linhas do CSV; devolve (criados, atualizados)."""
     count_upd = 0
 
-    for row in reader:
-        nome = (row.get("produto") or row.get("nome") or "").strip()
-        if not nome:
-            continue
+    # Lookups carregados uma vez: o loop não faz SELECT (nem flush) por linha.
+    # Os valores são Product (já no banco) ou o dict de um produto novo deste CSV.
+    by_ean: Dict[str, object] = {}
+    by_sku: Dict[str, object] = {}
+    by_nome: Dict[str, object] = {}
+    novos = []
 
-        ean = (row.get("ean") or "").strip() or None
-        sku = (row.get("sku") or "").strip() or None
+    def index(ean, sku, nome, alvo) -> None:
+        if ean:
+            by_ean[ean] = alvo
+        if sku:
+            by_sku[sku.lower()] = alvo
+        by_nome.setdefault(nome, alvo)
+
+    # Primeira passada: só as chaves do próprio CSV vão ao banco (IN por coluna,
+    # em fatias), não o catálogo inteiro da loja
+    parse = _csv_row_parser(reader.fieldnames or ())
+    recs = [rec for rec in map(parse, reader) if rec is not None]
+    # Com ON CONFLICT no banco, linha com EAN não é procurada: vai no upsert do fim
+    por_ean = upsert_disponivel()
+    eans = set() if por_ean else {r["ean"] for r in recs if r["ean"]}
+    skus = {r["sku"].lower() for r in recs if r["sku"]}
+    nomes = {r["nome"] for r in recs if not r["ean"] and not r["sku"]}
+    existentes: Dict[int, Product] = {}
+    for cond in _in_chunks(Product.ean, eans) + _in_chunks(func.lower(Product.sku), skus) + _in_chunks(Product.nome, nomes):
+        for p in Product.query.filter(Product.store_id == store_id, cond):
+            existentes[p.id] = p
+    # ordem de id: o mesmo "primeiro cadastrado vence" do by_nome
+    for pid in sorted(existentes):
+        p = existentes[pid]
+        index(p.ean, p.sku, p.nome, p)
+    cat_ids = set()
+    pedidas = {r["categoria_id"] for r in recs if r["categoria_id"] is not None}
+    for cond in _in_chunks(Category.id, pedidas):
+        cat_ids.update(cid for (cid,) in db.session.query(Category.id).filter(Category.store_id == store_id, cond))
+
+    # Versões de preço dos já existentes: um executemany no fim, não um add por linha
+    precos = []
+    agora = datetime.utcnow()
+    for rec in recs:
+        ean, sku = rec["ean"], rec["sku"]
 
-        q = Product.query.filter_by(store_id=store_id)
         if ean:
-            q = q.filter(Product.ean == ean)
+            p = by_ean.get(ean)
         elif sku:
-            q = q.filter(Product.sku == sku)
+            p = by_sku.get(sku.lower())  # mesmo critério do ux_products_store_sku_lower
         else:
-            q = q.filter(Product.nome == nome)
-        p = q.first()
-
-        def intval(s: Optional[str]) -> Optional[int]:
-            try:
-                return int(s) if s not in (None, "",) else None
-            except Exception:
-                return None
-
-        cat_id = intval(row.get("categoria_id"))
-        if cat_id:
-            ok = Category.query.filter_by(id=cat_id, store_id=store_id).first()
-            if not ok:
-                cat_id = None
-
-        payload = dict(
-            store_id=store_id,
-            nome=nome,
-            sku=sku,
-            ean=ean,
-            categoria_id=cat_id,
-            unidade=(row.get("unidade") or "UN"),
-            ncm=(row.get("ncm") or None),
-            cest=(row.get("cest") or None),
-            custo_atual=_dec(row.get("preco_compra") or row.get("custo_atual"), 2),
-            preco_venda=_dec(row.get("preco_venda"), 2),
-            margem_alvo=_dec(row.get("lucro_desejado") or row.get("margem_alvo"), 2),
-            estoque_minimo=_dec(row.get("estoque_minimo"), 4),
-            ponto_pedido=_dec(row.get("ponto_pedido"), 4),
-            ativo=(str(row.get("ativo") or "1").strip().lower() in ("1", "true", "sim")),
-        )
+            p = by_nome.get(rec["nome"])
+
+        if rec["categoria_id"] not in cat_ids:
+            rec["categoria_id"] = None
 
-        if p:
-            for k, v in payload.items():
+        if isinstance(p, Product):
+            # como no upsert por EAN: versão de preço só se o preço mudou
+            preco_antes = p.preco_venda
+            for k, v in rec.items():
                 setattr(p, k, v)
             count_upd += 1
+            if rec["preco_venda"] and rec["preco_venda"] > 0 and rec["preco_venda"] != preco_antes:
+                precos.append({"store_id": store_id, "product_id": p.id, "preco": rec["preco_venda"], "origem": "import",
+                               "valido_de": agora, "created_at": agora, "updated_at": agora})
+        elif p is not None:
+            # repetido dentro do próprio CSV: a última linha vale
+            p.update(rec)
+            count_upd += 1
         else:
-            p = Product(**payload)
-            db.session.add(p)
-            db.session.flush()
-            if not StockItem.query.filter_by(store_id=store_id, product_id=p.id).first():
-                db.session.add(StockItem(store_id=store_id, product_id=p.id, quantidade=Decimal("0.0000")))
-            count_new += 1
+            novos.append(rec)
+            p = rec
+        index(ean, sku, rec["nome"], p)
+
+    if precos:
+        db.session.execute(insert(PriceVersion), precos)
+    criados = 0
+    if por_ean:
+        com_ean = [r for r in novos if r["ean"]]
+        novos = [r for r in novos if not r["ean"]]
+        criados, upd = upsert_produtos_por_ean(store_id, com_ean, origem="import")
+        count_upd += upd
+    # Novos em lote: INSERT ... RETURNING + StockItem + PriceVersion, sem flush por linha
+    criar_produtos_em_lote(store_id, novos, origem="import")
+    db.session.commit()
+    return criados + len(novos), count_upd
 
-        if payload["preco_venda"] and payload["preco_venda"] > 0:
-            db.session.add(PriceVersion(store_id=store_id, product_id=p.id, preco=payload["preco_venda"], origem="import"))
 
-    db.session.commit()
+def _run_import_job(app, job_id: str, path: str, store_id: int) -> None:
+    with app.app_context():
+        try:
+            with open(path, encoding="utf-8-sig", errors="ignore", newline="") as fh:
+                criados, atualizados = _import_products(store_id, csv.DictReader(fh))
+            update_job(job_id, status="concluido", criados=criados, atualizados=atualizados)
+        except Exception as e:
+            db.session.rollback()
+            update_job(job_id, status="erro", erro=str(e))
+        finally:
+            os.remove(path)
+
+
+@bp.post("/import")
+@login_required
+def import_csv():
+    if not _role_can_edit():
+        flash("Acesso negado", "danger")
+        return redirect(url_for("products.list_"))
+
+    store_id = _require_store()
+    f = request.files.get("file")
+    if not f:
+        flash("Envie um arquivo CSV", "warning")
+        return redirect(url_for("products.list_"))
+
+    # Arquivo grande vai para o job_pool: o worker do request fica livre na hora
+    if (request.content_length or 0) > current_app.config.get("IMPORT_BACKGROUND_BYTES", 1 << 20):
+        # Estado em app.core.jobs (visível a todos os workers); o upload fica ao
+        # lado do JSON, e o prune apaga a sobra se o processo morrer no meio
+        job_id = create_job("import", store_id=store_id, status="executando", criados=0, atualizados=0)
+        path = job_file(job_id, "upload")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(f.stream, out)
+        job_pool.submit(_run_import_job, current_app._get_current_object(), job_id, path, store_id)
+        flash(
+            f"Importação em andamento (job {job_id}). Status em "
+            f"{url_for('products.import_status', job_id=job_id)} por até "
+            f"{current_app.config.get('JOBS_TTL_SECONDS', 3600) // 60} min.",
+            "info",
+        )
+        return redirect(url_for("products.list_"))
+
+    # Lê o upload em streaming (sem copiar o arquivo inteiro para uma str)
+    reader = csv.DictReader(TextIOWrapper(f.stream, encoding="utf-8-sig", errors="ignore", newline=""))
+    count_new, count_upd = _import_products(store_id, reader)
     flash(f"Importação concluída: {count_new} criados, {count_upd} atualizados.", "success")
     return redirect(url_for("products.list_"))
+
+
+@bp.get("/import/<job_id>")
+@login_required
+def import_status(job_id: str):
+    job = get_job(job_id, "import")
+    if job is None or job["store_id"] != _require_store():
+        abort(404)
+    return jsonify({k: v for k, v in job.items() if k not in ("kind", "store_id")})
@@ -1,47 +1,85 @@
 # app/views/setup.py
 from __future__ import annotations
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from typing import Tuple
+from flask import Blueprint, render_template, redirect, url_for, request, flash, g, current_app
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
 from app.extensions import db
 from app.core.models import Store, User
 from app.core.forms import StoreForm, UserCreateForm
 
 bp = Blueprint("setup", __name__, template_folder="../templates")
 
-def _needs_setup() -> bool:
-    return (Store.query.count() == 0) or (User.query.count() == 0)
+# Empresa e usuário não somem depois de criados: quando o setup fecha uma
+# vez, o guard deixa de consultar o banco a cada request (flag por processo).
+_SETUP_DONE = False
+
+def _setup_state() -> Tuple[bool, bool]:
+    """(tem empresa, tem usuário) num único SELECT.
+
+    Guardado em `g` junto com o id da primeira loja: o guard e a view do
+    setup leem o mesmo resultado, sem voltar ao banco no mesmo request.
+    """
+    global _SETUP_DONE
+    if _SETUP_DONE:
+        return True, True
+    if "_setup_state" not in g:
+        loja_id, tem_user = db.session.execute(
+            select(
+                select(Store.id).order_by(Store.id).limit(1).scalar_subquery(),
+                exists(select(User.id)),
+            ).execution_options(todas_lojas=True)
+        ).one()
+        g._setup_loja_id = loja_id
+        g._setup_state = (loja_id is not None, bool(tem_user))
+        if loja_id is not None and tem_user:
+            _SETUP_DONE = True
+    return g._setup_state
+
+def _primeira_loja_id() -> int:
+    # só chamado depois de _setup_state() ter devolvido tem_loja=True neste request
+    return g._setup_loja_id
+
+# Rotas liberadas enquanto o setup não termina
+_ALLOWED_EXACT = frozenset({"auth.login", "auth.login_post"})
+_ALLOWED_PREFIX = ("setup.", "static")
 
 @bp.before_app_request
 def guard_setup():
     # Se faltar empresa ou usuário, só libera rotas de setup, estáticos e login
-    if not _needs_setup():
+    tem_loja, tem_user = _setup_state()
+    if tem_loja and tem_user:
+        # Setup concluído: o guard sai da lista do app e não roda mais neste
+        # processo. Troca a lista em vez de remover dela (o Flask pode estar
+        # iterando a atual neste request)
+        funcs = current_app.before_request_funcs
+        funcs[None] = [f for f in funcs.get(None, []) if f is not guard_setup]
         return
-    allowed = request.endpoint and (
-        request.endpoint.startswith("setup.")
-        or request.endpoint.startswith("static")
-        or request.endpoint == "auth.login"
-        or request.endpoint == "auth.login_post"
-    )
+    ep = request.endpoint
+    allowed = ep and (ep in _ALLOWED_EXACT or ep.startswith(_ALLOWED_PREFIX))
     if not allowed:
         # Se já tem empresa e faltam usuários, manda para criar admin
-        if Store.query.count() > 0 and User.query.count() == 0:
+        if tem_loja and not tem_user:
             return redirect(url_for("setup.setup_admin"))
         return redirect(url_for("setup.welcome"))
 
 @bp.get("/setup")
 def welcome():
     # Se já tem empresa mas não tem usuário, pula direto para admin
-    if Store.query.count() > 0 and User.query.count() == 0:
+    tem_loja, tem_user = _setup_state()
+    if tem_loja and not tem_user:
         return redirect(url_for("setup.setup_admin"))
-    if not _needs_setup():
+    if tem_loja and tem_user:
         return redirect(url_for("dashboard.index"))
     return render_template("setup_welcome.html")
 
 @bp.route("/setup/company", methods=["GET", "POST"])
 def setup_company():
     # Se já existe empresa, volta para criar admin ou login
-    if Store.query.count() > 0:
+    tem_loja, tem_user = _setup_state()
+    if tem_loja:
         flash("Já existe uma empresa cadastrada neste ambiente.", "info")
-        if User.query.count() == 0:
+        if not tem_user:
             return redirect(url_for("setup.setup_admin"))
         return redirect(url_for("auth.login"))
 
@@ -64,21 +102,19 @@ def setup_company():
 
 @bp.route("/setup/admin", methods=["GET", "POST"])
 def setup_admin():
+    global _SETUP_DONE
     # Se não existe empresa ainda, volte para criar empresa
-    if Store.query.count() == 0:
+    tem_loja, tem_user = _setup_state()
+    if not tem_loja:
         return redirect(url_for("setup.setup_company"))
     # Se já existe usuário, não precisa deste passo
-    if not _needs_setup():
+    if tem_user:
         return redirect(url_for("dashboard.index"))
 
-    store = Store.query.first()
     form = UserCreateForm()
     if form.validate_on_submit():
-        if User.query.filter_by(email=form.email.data.lower()).first():
-            flash("E-mail já cadastrado", "danger")
-            return render_template("setup_admin.html", form=form)
         u = User(
-            store_id=store.id,
+            store_id=_primeira_loja_id(),
             nome=form.nome.data,
             email=form.email.data.lower(),
             role=form.role.data,
@@ -86,7 +122,14 @@ def setup_admin():
         )
         u.set_password(form.senha.data)
         db.session.add(u)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # e-mail já usado (ix_users_email_lower)
+            db.session.rollback()
+            flash("E-mail já cadastrado", "danger")
+            return render_template("setup_admin.html", form=form)
+        _SETUP_DONE = True
         flash("Administrador criado. Faça login.", "success")
         return redirect(url_for("auth.login"))
     return render_template("setup_admin.html", form=form)
\ No newline at end of file
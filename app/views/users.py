@@ -1,7 +1,11 @@
 # app/views/users.py
 from __future__ import annotations
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from datetime import datetime
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import login_required, current_user
+from sqlalchemy import tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import raiseload
 from app.extensions import db
 from app.core.models import User
 from app.core.forms import UserCreateForm, UserEditForm
@@ -11,6 +15,25 @@ bp = Blueprint("users", __name__, template_folder="../templates")
 def _ensure_admin():
     return getattr(current_user, "role", "") == "admin"
 
+def _get_user_or_404(uid: int) -> User:
+    # Busca por PK: sai do identity map sem SQL quando é o próprio usuário logado
+    u = db.session.get(User, uid)
+    if u is None or u.store_id != current_user.store_id:
+        abort(404)
+    return u
+
+_PAGE_SIZE = 50
+
+def _cursor():
+    """(created_at, id) do último usuário da página anterior, ou None."""
+    try:
+        return (
+            datetime.fromisoformat(request.args["after_ts"]),
+            int(request.args["after_id"]),
+        )
+    except (KeyError, ValueError):
+        return None
+
 @bp.get("/")
 @login_required
 def list_():
@@ -18,12 +41,32 @@ def list_():
         flash("Acesso negado", "danger")
         return redirect(url_for("dashboard.index"))
     q = request.args.get("q","").strip().lower()
-    query = User.query.filter_by(store_id=current_user.store_id).order_by(User.created_at.desc())
-    if q:
+    # A listagem só mostra colunas: raiseload faz um lazy load novo no template
+    # (ex.: u.store) estourar em vez de virar N+1 silencioso
+    query = (
+        User.query.options(raiseload("*"))
+        .filter_by(store_id=current_user.store_id)
+        .order_by(User.created_at.desc(), User.id.desc())
+    )
+    if len(q) >= 3:
+        # ILIKE direto na coluna: atendido pelos GIN de trigramas (ix_users_*_trgm)
         like = f"%{q}%"
+        query = query.filter(User.nome.ilike(like) | User.email.ilike(like))
+    elif q:
+        # Curto demais para trigrama: só prefixo
+        like = f"{q}%"
         query = query.filter(db.func.lower(User.nome).like(like) | db.func.lower(User.email).like(like))
-    items = query.limit(200).all()
-    return render_template("users_list.html", items=items, q=q)
+    # Paginação por chave (ix_users_store_created): a página N custa o mesmo que a 1ª
+    cursor = _cursor()
+    if cursor:
+        query = query.filter(tuple_(User.created_at, User.id) < cursor)
+    items = query.limit(_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(items) > _PAGE_SIZE:
+        items = items[:_PAGE_SIZE]
+        last = items[-1]
+        next_cursor = {"after_ts": last.created_at.isoformat(), "after_id": last.id}
+    return render_template("users_list.html", items=items, q=q, next_cursor=next_cursor)
 
 @bp.route("/new", methods=["GET","POST"])
 @login_required
@@ -33,9 +76,6 @@ def new():
         return redirect(url_for("dashboard.index"))
     form = UserCreateForm()
     if form.validate_on_submit():
-        if User.query.filter_by(email=form.email.data.lower()).first():
-            flash("E-mail já cadastrado", "danger")
-            return render_template("user_form.html", form=form)
         u = User(
             store_id=current_user.store_id,
             nome=form.nome.data,
@@ -45,7 +85,13 @@ def new():
         )
         u.set_password(form.senha.data)
         db.session.add(u)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # e-mail é único no ambiente todo, não por loja (ix_users_email_lower)
+            db.session.rollback()
+            flash("E-mail já cadastrado", "danger")
+            return render_template("user_form.html", form=form)
         flash("Usuário criado", "success")
         return redirect(url_for("users.list_"))
     return render_template("user_form.html", form=form)
@@ -56,21 +102,22 @@ def edit(uid: int):
     if not _ensure_admin():
         flash("Acesso negado", "danger")
         return redirect(url_for("dashboard.index"))
-    u = User.query.filter_by(id=uid, store_id=current_user.store_id).first_or_404()
+    u = _get_user_or_404(uid)
     form = UserEditForm(obj=u)
     if form.validate_on_submit():
-        # Evita trocar para email já existente
-        exists = User.query.filter(User.email == form.email.data.lower(), User.id != u.id).first()
-        if exists:
-            flash("E-mail já cadastrado", "danger")
-            return render_template("user_form.html", form=form, user=u)
         u.nome = form.nome.data
         u.email = form.email.data.lower()
         u.role = form.role.data
         u.ativo = bool(form.ativo.data)
         if form.nova_senha.data:
             u.set_password(form.nova_senha.data)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Trocou para um e-mail que já existe
+            db.session.rollback()
+            flash("E-mail já cadastrado", "danger")
+            return render_template("user_form.html", form=form, user=u)
         flash("Usuário atualizado", "success")
         return redirect(url_for("users.list_"))
     return render_template("user_form.html", form=form, user=u)
@@ -81,8 +128,12 @@ def toggle(uid: int):
     if not _ensure_admin():
         flash("Acesso negado", "danger")
         return redirect(url_for("dashboard.index"))
-    u = User.query.filter_by(id=uid, store_id=current_user.store_id).first_or_404()
-    u.ativo = not u.ativo
+    # NOT ativo no próprio UPDATE, como no toggle de produtos: sem SELECT antes
+    res = db.session.execute(
+        update(User).where(User.id == uid, User.store_id == current_user.store_id).values(ativo=~User.ativo)
+    )
+    if not res.rowcount:
+        abort(404)
     db.session.commit()
     flash("Status atualizado", "info")
     return redirect(url_for("users.list_"))
@@ -5,5 +5,26 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///mercearia.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool de conexões do banco servidor, por processo (ignorado no SQLite)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    # Entradas do cache de SQL compilado do SQLAlchemy (padrão da lib: 500)
+    DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
     SESSION_COOKIE_SAMESITE = "Lax"
     SESSION_COOKIE_SECURE = False
+    # Cache de navegador para estáticos pedidos sem ?v= (os versionados ficam 1 ano)
+    SEND_FILE_MAX_AGE_DEFAULT = int(os.getenv("SEND_FILE_MAX_AGE_DEFAULT", "3600"))
+    # CSRFProtect valida uma vez por request (os FlaskForm reaproveitam via g.csrf_valid);
+    # sem expiração o token dura a sessão toda e o PDV não falha no meio do turno
+    WTF_CSRF_TIME_LIMIT = None
+    # Cria as tabelas no create_app (só dev); fora disso use `flask init-db`
+    AUTO_CREATE_ALL = os.getenv("AUTO_CREATE_ALL", "0") == "1"
+    # Uploads de CSV acima disso são importados em background (job_pool)
+    IMPORT_BACKGROUND_BYTES = int(os.getenv("IMPORT_BACKGROUND_BYTES", str(1 << 20)))
+    # Catálogos com mais produtos que isso são exportados em background (job_pool)
+    EXPORT_BACKGROUND_ROWS = int(os.getenv("EXPORT_BACKGROUND_ROWS", "50000"))
+    # Estado/arquivos dos jobs de import/export (app.core.jobs); vazio = instance/jobs.
+    # Com vários servidores, apontar para um volume compartilhado
+    JOBS_DIR = os.getenv("JOBS_DIR", "")
+    # Jobs sem alteração há mais que isso são apagados (status e arquivos)
+    JOBS_TTL_SECONDS = int(os.getenv("JOBS_TTL_SECONDS", "3600"))